@@ -0,0 +1,27 @@
+import argparse
+
+import telebot
+
+from benchmarks.fake_api import FakeBotAPI
+from broadcast import Broadcaster
+
+
+def run(chats, latency, throttle_every, workers, rate):
+    with FakeBotAPI(latency=latency, throttle_every=throttle_every) as api:
+        bot = telebot.TeleBot("123:fake", threaded=False)
+        broadcaster = Broadcaster(workers=workers, rate=rate, chat_interval=0, backoff=0.1)
+        stats = broadcaster.run(range(1, chats + 1), lambda chat_id: bot.send_message(chat_id, "Доброе утро!😺"))
+        print(f"workers={workers:<3} rate={rate:<6} {stats} (запросов к API: {api.requests})")
+        return stats
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_broadcast --chats 300 --latency 0.05
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--throttle-every", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=30)
+    args = parser.parse_args()
+    for workers in (1, 4, 8, 16):
+        run(args.chats, args.latency, args.throttle_every, workers, args.rate if workers > 1 else 10 ** 6)
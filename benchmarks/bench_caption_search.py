@@ -0,0 +1,44 @@
+import argparse
+import os
+import random
+import sqlite3 as sql
+import tempfile
+
+from benchmarks.bench_random_photo import per_call_ms, prepare
+from db import ConnectionPool
+from photos import CaptionIndex, create_caption_folded, create_photo_fts
+
+WORDS = ["рыжий", "котик", "спящий", "в коробке", "на окне", "пушистый", "серый", "зевает", "с клубком", "лапки"]
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_caption_search --rows 10000 100000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10 ** 4, 10 ** 5])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare(path, rows)
+            rng = random.Random(rows)
+            with sql.connect(path) as con:
+                con.executemany("UPDATE photo SET caption = ? WHERE id = ?",
+                                ((" ".join(rng.sample(WORDS, 3)) + f" {i}", i) for i in range(1, rows + 1)))
+            con.close()
+            pool = ConnectionPool(path)
+            captions = [row[0] for row in pool.fetchall("SELECT caption FROM photo ORDER BY RANDOM() LIMIT ?", (args.calls,))]
+            # Как было: точное сравнение подписи по таблице без индекса
+            scan = per_call_ms(lambda: pool.fetchone("SELECT file_id FROM photo WHERE caption = ?",
+                                                     (rng.choice(captions),)), max(1, args.calls // 10))
+            with pool.connection() as con:
+                c = con.cursor()
+                create_caption_folded(c)
+                create_photo_fts(c)
+            index = CaptionIndex(pool)
+            exact = per_call_ms(lambda: index.find(rng.choice(captions)), args.calls)
+            folded = per_call_ms(lambda: CaptionIndex(pool).find(rng.choice(captions).upper()), args.calls)
+            typo = per_call_ms(lambda: index.suggest(rng.choice(captions)[:-3] + "х"), args.calls)
+            pool.close()
+        print(f"{rows:>8} строк: полный скан {scan:.3f} мс, точный/кэш {exact:.3f} мс, "
+              f"без учёта регистра {folded:.3f} мс, похожие {typo:.3f} мс")
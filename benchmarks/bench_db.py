@@ -0,0 +1,73 @@
+import argparse
+import os
+import sqlite3 as sql
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import ConnectionPool
+
+
+def prepare(path, chats):
+    with sql.connect(path) as con:
+        con.execute("CREATE TABLE chats (chat_id INTEGER PRIMARY KEY, title TEXT, is_active INTEGER DEFAULT 1, mailing_time TEXT DEFAULT '09:00')")
+        con.executemany("INSERT INTO chats (chat_id, title) VALUES (?, ?)", ((i, f"Chat {i}") for i in range(chats)))
+    con.close()
+
+
+def op_old(path, i, chats):
+    # Как было: новое соединение на каждый вызов, которое никто не закрывает
+    with sql.connect(path) as con:
+        c = con.cursor()
+        if i % 10 == 0:
+            c.execute("UPDATE chats SET mailing_time = ? WHERE chat_id = ?", ("10:00", i % chats))
+        else:
+            c.execute("SELECT title FROM chats WHERE chat_id = ?", (i % chats,))
+            c.fetchone()
+
+
+def op_pool(pool, i, chats):
+    with pool.connection() as con:
+        c = con.cursor()
+        if i % 10 == 0:
+            c.execute("UPDATE chats SET mailing_time = ? WHERE chat_id = ?", ("10:00", i % chats))
+        else:
+            c.execute("SELECT title FROM chats WHERE chat_id = ?", (i % chats,))
+            c.fetchone()
+
+
+def measure(name, op, ops, threads):
+    errors = 0
+
+    def run(i):
+        nonlocal errors
+        try:
+            op(i)
+        except sql.OperationalError:
+            errors += 1
+
+    started = time.perf_counter()
+    if threads == 1:
+        for i in range(ops):
+            run(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(run, range(ops)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<6} потоков={threads:<2} {ops / elapsed:>10.0f} оп/с, ошибок {errors}")
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_db --ops 20000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=10000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare(path, args.chats)
+        for threads in (1, 8):
+            measure("old", lambda i: op_old(path, i, args.chats), args.ops, threads)
+            pool = ConnectionPool(path, size=threads)
+            measure("pool", lambda i: op_pool(pool, i, args.chats), args.ops, threads)
+            pool.close()
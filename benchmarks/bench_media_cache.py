@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+
+import telebot
+
+from benchmarks.fake_api import FakeBotAPI
+from broadcast import Broadcaster
+from db import ConnectionPool
+from photos import MediaCache, create_media_cache_table
+
+CAT_URL = "https://cdn.example/cat.jpg"
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_media_cache --chats 200 --url-latency 0.3
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--url-latency", type=float, default=0.3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI(latency=args.latency, url_latency=args.url_latency):
+        db = ConnectionPool(os.path.join(tmp, "bench.db"))
+        with db.connection() as con:
+            create_media_cache_table(con.cursor())
+        media_cache = MediaCache(db)
+        bot = telebot.TeleBot("123:fake", threaded=False)
+        chat_ids = list(range(1, args.chats + 1))
+
+        broadcaster = Broadcaster(workers=8, rate=10 ** 6, chat_interval=0)
+        stats = broadcaster.run(chat_ids, lambda chat_id: bot.send_photo(chat_id, CAT_URL, caption="Доброе утро!😺"))
+        print(f"по ссылке:  {stats}")
+
+        photo = CAT_URL
+
+        def send(chat_id):
+            global photo
+            msg = bot.send_photo(chat_id, photo, caption="Доброе утро!😺")
+            if photo == CAT_URL:
+                photo = media_cache.remember(CAT_URL, msg)
+            return msg
+
+        broadcaster = Broadcaster(workers=8, rate=10 ** 6, chat_interval=0)
+        stats = broadcaster.run(chat_ids[:1], send)
+        stats = broadcaster.run(chat_ids[1:], send, stats)
+        print(f"по file_id: {stats}")
+        db.close()
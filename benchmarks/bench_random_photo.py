@@ -0,0 +1,49 @@
+import argparse
+import os
+import sqlite3 as sql
+import tempfile
+import time
+
+from db import ConnectionPool
+from photos import PhotoPool
+
+
+def prepare(path, rows):
+    with sql.connect(path) as con:
+        con.execute("CREATE TABLE photo (id INTEGER PRIMARY KEY AUTOINCREMENT, file_id TEXT NOT NULL, caption TEXT DEFAULT 'Нет подписи')")
+        con.executemany("INSERT INTO photo (file_id, caption) VALUES (?, ?)",
+                        ((f"AgACAgIAAxkBAAI{i:012d}", f"котик {i}") for i in range(rows)))
+    con.close()
+
+
+def per_call_ms(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1000
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_random_photo --rows 10000 100000 1000000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare(path, rows)
+            pool = ConnectionPool(path)
+            order_by_random = per_call_ms(
+                lambda: pool.fetchone("SELECT file_id FROM photo ORDER BY RANDOM() LIMIT 1"), max(1, args.calls // 10))
+            photos = PhotoPool(pool)
+            started = time.perf_counter()
+            photos.pick()
+            load_ms = (time.perf_counter() - started) * 1000
+            cached = per_call_ms(photos.pick, args.calls)
+            no_repeats = PhotoPool(pool, no_repeats=True)
+            no_repeats.pick(1)
+            per_chat = per_call_ms(lambda: no_repeats.pick(1), args.calls)
+            pool.close()
+        print(f"{rows:>8} строк: ORDER BY RANDOM() {order_by_random:8.3f} мс, PhotoPool {cached:.3f} мс "
+              f"(загрузка {load_ms:.0f} мс), без повторов {per_chat:.3f} мс")
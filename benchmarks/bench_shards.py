@@ -0,0 +1,58 @@
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+import telebot
+
+from benchmarks.fake_api import FakeBotAPI
+from db import ConnectionPool
+from deliveries import DeliveryLedger, create_deliveries_table
+from shards import run_shards
+
+
+def prepare(path):
+    db = ConnectionPool(path)
+    with db.connection() as con:
+        c = con.cursor()
+        c.execute("CREATE TABLE birthdays (id INTEGER PRIMARY KEY, chat_id INTEGER, name TEXT, birthday_md TEXT)")
+        create_deliveries_table(c)
+    return db
+
+
+def run(chats, processes, threads, rate, latency, throttle_every):
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI(latency=latency, throttle_every=throttle_every) as api:
+        path = os.path.join(tmp, "bench.db")
+        db = prepare(path)
+        day = "2026-01-01"
+        run_id = f"bench-{processes}"
+        ledger = DeliveryLedger(db)
+        ledger.enqueue(ledger.claim(list(range(1, chats + 1)), day), day, run_id)
+        job = {'db': path, 'token': "123:fake", 'api_url': telebot.apihelper.API_URL, 'run_id': run_id, 'day': day,
+               'slot_time': datetime(2026, 1, 1, 9), 'photo': "file_id", 'photos': None, 'cat': False,
+               'threads': threads, 'rate': rate / processes, 'batch_size': threads * 5, 'lease_seconds': 300}
+        stats, _ = run_shards(job, processes, ledger)
+        sent = db.fetchone("SELECT COUNT(*) FROM deliveries WHERE status = 'sent'")[0]
+        db.close()
+        # Заглушка API сама живёт в одном процессе и выдерживает порядка 350 запросов/с, поэтому задержку ответа
+        # берём побольше, а потоков на процесс поменьше: так упираемся в процессы рассылки, а не в заглушку.
+        # В elapsed входит запуск процессов (spawn и импорт telebot), на коротких рассылках он заметен
+        print(f"processes={processes:<3} {stats} (в журнале sent: {sent}, запросов к API: {api.requests})")
+        return stats
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_shards --chats 1000 --threads 2 --latency 0.2
+    # python -m benchmarks.bench_shards --rate 30   (упор в лимит Telegram: процессы уже не помогают)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=10 ** 6)
+    args = parser.parse_args()
+    base = None
+    for processes in (1, 2, 4, 8):
+        stats = run(args.chats, processes, args.threads, args.rate, args.latency, args.throttle_every)
+        base = base or stats.throughput
+        print(f"  ускорение x{stats.throughput / base:.2f}")
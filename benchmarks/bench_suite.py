@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+
+from benchmarks.fake_api import FakeBotAPI
+from benchmarks.harness import message
+from benchmarks.synthetic import MAILING_SLOT, populate
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def traced_peak_kb(op, calls):
+    # Отдельный короткий проход под tracemalloc: он сам замедляет код в разы, поэтому время меряем без него
+    tracemalloc.start()
+    try:
+        for i in range(calls):
+            op(i)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench(name, size, op, calls, warmup=20, traced_calls=20):
+    # Прогрев: кэш страниц SQLite, подготовленные запросы, соединения с заглушкой. Индексы сдвинуты, чтобы замер
+    # не попадал в уже прогретые строки
+    for i in range(min(calls, warmup)):
+        op(calls * 2 + i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(calls):
+        call_started = time.perf_counter()
+        op(i)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return {"scenario": name, "size": size, "ops": calls, "throughput": calls / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000, "p99_ms": percentile(latencies, 99) * 1000,
+            "peak_kb": traced_peak_kb(lambda i: op(calls + i), min(calls, traced_calls))}
+
+
+def bench_mailing(main, size, due):
+    # Рассылка по всем чатам слота после прогревочной; пропускная способность — сообщений в секунду,
+    # p99 — задержка отправки
+    captured = []
+    record_mailing = main.record_mailing
+
+    def capture(mailing_time, day, stats, elapsed):
+        captured.append((stats, elapsed))
+        record_mailing(mailing_time, day, stats, elapsed)
+    main.record_mailing = capture
+    main.load_mailing_schedule()
+    first_day = datetime(2030, 1, 1, 9, 0)
+    # Каждый проход — новый день, иначе журнал рассылок не пустит повторную отправку
+    main.morning_mailing(MAILING_SLOT, first_day - timedelta(days=1))
+    main.morning_mailing(MAILING_SLOT, first_day)
+    stats, elapsed = captured[-1]
+    peak_kb = traced_peak_kb(lambda i: main.morning_mailing(MAILING_SLOT, first_day + timedelta(days=i + 1)), 1)
+    main.record_mailing = record_mailing
+    return {"scenario": "mailing", "size": size, "ops": stats.sent, "throughput": stats.sent / elapsed,
+            "p50_ms": stats.percentile(50) * 1000, "p99_ms": stats.percentile(99) * 1000, "peak_kb": peak_kb,
+            "failed": stats.failed, "chats": due}
+
+
+def run_size(size, options):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeBotAPI(latency=options["latency"], throttle_every=options["throttle_every"],
+                       retry_after=options["retry_after"]):
+        from benchmarks.harness import load_main
+        main = load_main(os.path.join(tmp, "bench.db"), MAILING_WORKERS=options["workers"])
+        started = time.perf_counter()
+        due = min(size, options["mailing_chats"])
+        captions = populate(main.db, size, size, size, mailing_chats=due)
+        print(f"[{size}] база: {size} чатов, дней рождения и фото за {time.perf_counter() - started:.1f} с")
+        chat_ids = [row[0] for row in main.db.fetchall("SELECT chat_id FROM chats")]
+        calls = options["calls"]
+        results = [bench_mailing(main, size, due)]
+
+        # Поиск фото: точная подпись, опечатка (подсказки через FTS) и случайное фото для рассылки
+        results.append(bench("photo_exact", size, lambda i: main.get_photo(message(captions[i % len(captions)])), calls))
+        results.append(bench("photo_suggest", size,
+                             lambda i: main.get_photo(message(captions[i % len(captions)][:-1] + "x")), calls))
+        results.append(bench("random_photo", size, lambda i: main.get_random_photo(), calls * 10))
+
+        # Команды дней рождения целиком, через обработчики telebot
+        def list_birthdays(i):
+            main.bot.process_new_messages([message(f"/list_birthdays {rng.choice(chat_ids)}")])
+
+        def add_remove_birthday(i):
+            chat_id = rng.choice(chat_ids)
+            main.bot.process_new_messages([message(f"/add_birthday {chat_id} 01-02-2000 Бенчмарк {i}")])
+            main.bot.process_new_messages([message(f"/remove_birthday {chat_id} Бенчмарк {i}")])
+
+        results.append(bench("list_birthdays", size, list_birthdays, calls))
+        results.append(bench("add_remove_birthday", size, add_remove_birthday, calls))
+        results.append(bench("mailing_birthdays", size,
+                             lambda i: main.get_birthdays(main.db, chat_ids[:due], datetime(2030, 1, 1) + timedelta(days=i)),
+                             calls))
+        main.db.close()
+        return results
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def spread(values):
+    # Разброс прогонов относительно медианы
+    center = median(values)
+    return (max(values) - min(values)) / center if center else 0.0
+
+
+def combine(runs):
+    # runs — результаты одного сценария из нескольких процессов; в отчёт идут медианы и разброс между прогонами
+    result = dict(runs[0])
+    for key in ("throughput", "p50_ms", "p99_ms", "peak_kb"):
+        result[key] = median([r[key] for r in runs])
+    result["repeat"] = len(runs)
+    result["throughput_noise"] = spread([r["throughput"] for r in runs])
+    result["p99_noise"] = spread([r["p99_ms"] for r in runs])
+    return result
+
+
+def report(results, baseline, threshold, floor_ms=0.1):
+    # Порог не ниже разброса прогонов ни в текущих результатах, ни в эталоне: иначе шум машины выдаётся за
+    # регрессию. Рост p99 меньше floor_ms — это точность таймера, а не код
+    known = {(r["scenario"], r["size"]): r for r in baseline}
+    regressions = 0
+    for r in results:
+        line = (f"{r['scenario']:<20} {r['size']:>8} {r['ops']:>6} оп. x{r.get('repeat', 1)} {r['throughput']:>9.1f} оп/с "
+                f"p50 {r['p50_ms']:>8.2f} мс p99 {r['p99_ms']:>8.2f} мс память {r['peak_kb']:>8.0f} КБ "
+                f"разброс {r.get('throughput_noise', 0):.0%}")
+        base = known.get((r["scenario"], r["size"]))
+        if base:
+            speed = r["throughput"] / base["throughput"] - 1
+            tail = r["p99_ms"] / base["p99_ms"] - 1 if base["p99_ms"] else 0.0
+            speed_limit = max(threshold, r.get("throughput_noise", 0), base.get("throughput_noise", 0))
+            tail_limit = max(threshold, r.get("p99_noise", 0), base.get("p99_noise", 0))
+            line += f"  ({speed:+.0%} оп/с, {tail:+.0%} p99)"
+            if speed < -speed_limit or (tail > tail_limit and r["p99_ms"] - base["p99_ms"] > floor_ms):
+                regressions += 1
+                line += "  РЕГРЕССИЯ"
+        print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_suite --sizes 1000 10000 100000 --json base.json
+    # python -m benchmarks.bench_suite --sizes 1000 10000 100000 --compare base.json
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10 ** 3, 10 ** 4, 10 ** 5])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5, help="прогонов каждого размера, сравниваются медианы")
+    parser.add_argument("--mailing-chats", type=int, default=1000, help="сколько чатов в слоте рассылки, не больше size")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка заглушки Bot API, с")
+    parser.add_argument("--throttle-every", type=int, default=0, help="каждый N-й запрос получает 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты")
+    parser.add_argument("--compare", help="сравнить с сохранёнными результатами")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="допустимое ухудшение, доля; если прогоны разбросаны сильнее, порогом служит разброс")
+    args = parser.parse_args()
+    options = {"calls": args.calls, "mailing_chats": args.mailing_chats, "workers": args.workers,
+               "latency": args.latency, "throttle_every": args.throttle_every, "retry_after": args.retry_after}
+    results = []
+    for size in args.sizes:
+        # Каждый прогон — в новом процессе: main импортируется один раз на базу, память не копится между прогонами,
+        # а в разброс попадает и то, что меняется от процесса к процессу (частота процессора, кэш файлов)
+        runs = []
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                runs.append(executor.submit(run_size, size, options).result())
+        results += [combine(list(scenario)) for scenario in zip(*runs)]
+    baseline = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.threshold)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    if regressions:
+        raise SystemExit(f"Регрессий: {regressions}")
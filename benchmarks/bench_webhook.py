@@ -0,0 +1,88 @@
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import telebot
+
+from benchmarks.fake_api import FakeBotAPI
+from webhook import UpdateDispatcher, WebhookServer
+
+
+def synthetic_updates(count, chats):
+    for update_id in range(1, count + 1):
+        chat_id = random.randint(1, chats)
+        yield json.dumps({"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "text": "/get_photo",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 10}],
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"}}})
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def run(updates, workers, queue_size, latency, clients):
+    with FakeBotAPI(latency=latency):
+        bot = telebot.TeleBot("123:fake", threaded=False)
+        last_seen = {}
+        out_of_order = 0
+
+        @bot.message_handler(commands=["get_photo"])
+        def reply(message):
+            nonlocal out_of_order
+            if last_seen.get(message.chat.id, 0) > message.message_id:
+                out_of_order += 1
+            last_seen[message.chat.id] = message.message_id
+            bot.send_message(message.chat.id, "Напишите подпись фото для того, чтобы я вам его вывел")
+
+        dispatcher = UpdateDispatcher(lambda update: bot.process_new_updates([update]), workers=workers,
+                                      queue_size=queue_size)
+        dispatcher.start()
+        server = WebhookServer(dispatcher, host="127.0.0.1", port=0).start()
+        url = f"http://127.0.0.1:{server.port}/webhook"
+        session = requests.Session()
+        statuses = {}
+
+        def post(body):
+            status = session.post(url, data=body.encode(), headers={'Content-Type': 'application/json'}).status_code
+            statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        # Клиенты шлют обновления одного чата из разных потоков, поэтому порядок внутри чата держим по одному клиенту
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(post, updates))
+        while dispatcher.depth() or dispatcher.processed < statuses.get(200, 0):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        server.stop()
+        dispatcher.stop()
+        latencies = list(dispatcher.latencies)
+        print(f"workers={workers:<3} обработано {dispatcher.processed} за {elapsed:.1f} с "
+              f"({dispatcher.processed / elapsed:.0f} обн/с), p50 {percentile(latencies, 50) * 1000:.0f} мс, "
+              f"p99 {percentile(latencies, 99) * 1000:.0f} мс, отказов (503) {statuses.get(503, 0)}, "
+              f"не по порядку {out_of_order if clients == 1 else '-'}")
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.bench_webhook --count 2000
+    # python -m benchmarks.bench_webhook --updates updates.jsonl   (файл пишет WebhookServer(record=...))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=1)
+    args = parser.parse_args()
+    if args.updates:
+        with open(args.updates, encoding="utf-8") as f:
+            updates = [line for line in f if line.strip()]
+    else:
+        updates = list(synthetic_updates(args.count, args.chats))
+    for workers in (1, 4, 16):
+        run(updates, workers, args.queue_size, args.latency, args.clients)
@@ -0,0 +1,180 @@
+import json
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from threading import Lock, Thread
+from urllib.parse import parse_qs
+
+import telebot
+
+
+class FakeBotAPI:
+    # Локальная заглушка Bot API: отвечает на любой метод с заданной задержкой и каждым N-м запросом отдаёт 429.
+    # url_latency — сколько «Telegram» качает картинку, присланную ссылкой, а не file_id. В чаты из fail_chats
+    # отправка не проходит (400, как для удалённого чата), sent считает успешные отправки по чатам
+    def __init__(self, latency=0.0, throttle_every=0, retry_after=1, url_latency=0.0, fail_chats=(), host="127.0.0.1",
+                 port=0):
+        self.latency = latency
+        self.url_latency = url_latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.fail_chats = set(fail_chats)
+        self.calls = {}
+        self.sent = Counter()
+        self.requests = 0
+        self.lock = Lock()
+        self.message_ids = count(1)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, как у настоящего API: иначе на каждый запрос новое TCP-соединение и заглушка упирается в себя
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b""
+                path, _, query = self.path.partition("?")
+                method = path.rsplit("/", 1)[-1]
+                params = {k: v[0] for k, v in parse_qs(query).items()}
+                if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                    params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+                status, payload = api.respond(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, method, params):
+        with self.lock:
+            self.requests += 1
+            self.calls[method] = self.calls.get(method, 0) + 1
+            throttled = self.throttle_every and self.requests % self.throttle_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if self.url_latency and params.get("photo", "").startswith("http"):
+            time.sleep(self.url_latency)
+        if throttled:
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+        if method.startswith("send"):
+            chat_id = int(params.get("chat_id", 0))
+            if chat_id in self.fail_chats:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}
+            with self.lock:
+                self.sent[chat_id] += 1
+        return 200, {"ok": True, "result": self.result(method, params)}
+
+    def result(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == "getChat":
+            chat_id = int(params.get("chat_id", 0))
+            return {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"}
+        if method.startswith("send"):
+            message = {"message_id": next(self.message_ids), "date": int(time.time()),
+                       "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"}}
+            if method == "sendPhoto":
+                file_id = params.get("photo") or "fake-file-id"
+                if file_id.startswith("http"):
+                    file_id = f"fake-{abs(hash(file_id))}"
+                message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+                message["caption"] = params.get("caption", "")
+            else:
+                message["text"] = params.get("text", "")
+            return message
+        return True
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        telebot.apihelper.API_URL = self.url + "/bot{0}/{1}"
+        return self
+
+    def stop(self):
+        telebot.apihelper.API_URL = None
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeCatAPI:
+    # Заглушка TheCatAPI для config.CAT_API_URL: отдаёт ссылки на картинки, может тормозить или падать
+    def __init__(self, latency=0.0, fail=False, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.fail = fail
+        self.requests = 0
+        self.images = count(1)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/v1/images/search"
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.requests += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                if api.fail:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                limit = int(parse_qs(self.path.partition("?")[2]).get("limit", ["1"])[0])
+                data = json.dumps([{"id": str(i), "url": f"https://cdn.example/cat{i}.jpg"}
+                                   for i in (next(api.images) for _ in range(limit))]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
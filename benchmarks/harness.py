@@ -0,0 +1,36 @@
+import sys
+import time
+from types import ModuleType
+
+from telebot import types
+
+ADMIN_ID = 1
+
+
+def load_main(db_path, **settings):
+    # config.py пользователя не нужен: подставляем свой модуль до импорта main. Импорт main ничего не запускает,
+    # а обработчики выполняем в текущем потоке, чтобы мерить их целиком
+    if "main" in sys.modules:
+        raise RuntimeError("main уже импортирован в этом процессе, для другой базы нужен новый процесс")
+    config = ModuleType("config")
+    config.BOT_TOKEN = "123:fake"
+    config.ADMIN_IDS = [ADMIN_ID]
+    config.DATE_FORMAT = '%d-%m-%Y'
+    config.TIME_FORMAT = '%H:%M'
+    config.DB_NAME = db_path
+    config.MAILING_RATE = 10 ** 6
+    config.__dict__.update(settings)
+    sys.modules["config"] = config
+    import main
+    main.bot.threaded = False
+    main.init_db()
+    return main
+
+
+def message(text, chat_id=ADMIN_ID, chat_type="private", user_id=ADMIN_ID):
+    data = {"message_id": 1, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Admin"}}
+    if text.startswith("/"):
+        data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return types.Message.de_json(data)
@@ -0,0 +1,85 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from photos import fold_caption
+
+FIRST_NAMES = ("Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна", "Иван", "Ксения", "Лев", "Мария", "Никита",
+               "Ольга", "Павел", "Рита", "Семён", "Таня", "Фёдор")
+LAST_NAMES = ("Иванов", "Петрова", "Смирнов", "Кузнецова", "Попов", "Соколова", "Лебедев", "Козлова", "Новиков")
+WORDS = ("рыжий", "котик", "спит", "на", "окне", "пушистый", "серый", "играет", "с", "клубком", "в", "коробке",
+         "зима", "лето", "дача", "диван", "утро", "чёрный", "котёнок", "лапа", "хвост", "мурлыка")
+MAILING_SLOT = "09:00"
+BATCH = 10000
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(db, query, rows):
+    for batch in _batches(rows):
+        with db.connection() as con:
+            con.executemany(query, batch)
+
+
+def populate(db, chats, birthdays, photos, mailing_chats=None, date_format='%d-%m-%Y', seed=0):
+    # Схему создаёт main.init_db, здесь только данные. В слот MAILING_SLOT попадают первые mailing_chats чатов,
+    # остальные разбросаны по другим минутам с 7 до 12 часов
+    rng = random.Random(seed)
+    mailing_chats = chats if mailing_chats is None else min(mailing_chats, chats)
+    other_slots = [f"{h:02d}:{m:02d}" for h in range(7, 12) for m in range(60) if f"{h:02d}:{m:02d}" != MAILING_SLOT]
+    _insert(db, "INSERT INTO chats (chat_id, title, mailing_time) VALUES (?, ?, ?)",
+            ((-1000000000000 - i, f"Чат {i}", MAILING_SLOT if i < mailing_chats else rng.choice(other_slots))
+             for i in range(chats)))
+
+    first_day = date(1950, 1, 1)
+
+    def birthday_rows():
+        for i in range(birthdays):
+            born = first_day + timedelta(days=rng.randrange(60 * 365))
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            yield -1000000000000 - rng.randrange(chats), name, born.strftime(date_format), born.strftime("%m-%d")
+    _insert(db, "INSERT INTO birthdays (chat_id, name, birthday_date, birthday_md) VALUES (?, ?, ?, ?)",
+            birthday_rows())
+
+    captions = []
+
+    def photo_rows():
+        for i in range(photos):
+            caption = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))) + f" {i}"
+            if len(captions) < 1000:
+                captions.append(caption)
+            yield f"AgACAgIAAxkBAAI{i:012d}", caption, fold_caption(caption)
+    _insert(db, "INSERT INTO photo (file_id, caption, caption_folded) VALUES (?, ?, ?)", photo_rows())
+    # Подписи, которые точно есть в базе, — для замеров поиска фото
+    return captions
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.synthetic bench.db --rows 100000
+    # Создаёт базу со схемой бота; её можно подложить боту в config.DB_NAME
+    from benchmarks.harness import load_main
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db")
+    parser.add_argument("--rows", type=int, default=10 ** 4, help="по умолчанию для чатов, дней рождения и фото")
+    parser.add_argument("--chats", type=int)
+    parser.add_argument("--birthdays", type=int)
+    parser.add_argument("--photos", type=int)
+    parser.add_argument("--mailing-chats", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main = load_main(args.db)
+    started = time.perf_counter()
+    populate(main.db, args.chats or args.rows, args.birthdays or args.rows, args.photos or args.rows,
+             args.mailing_chats, seed=args.seed)
+    print(f"База {args.db} заполнена за {time.perf_counter() - started:.1f} с")
@@ -0,0 +1,100 @@
+import calendar
+
+
+def create_birthdays_list_index(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_chat_md ON birthdays (chat_id, birthday_md)")
+
+
+# Список идёт по кругу от сегодняшнего дня: сначала даты с сегодняшней до конца года, потом с начала года,
+# в конце — записи, дату которых не удалось разобрать
+SEGMENTS = (
+    ("birthday_md >= ?", True),
+    ("birthday_md < ?", True),
+    ("birthday_md IS NULL", False),
+)
+
+
+def _segment_rows(db, chat_id, today, segment, after, descending, limit):
+    where, uses_today = SEGMENTS[segment]
+    query = f"SELECT birthday_md, id, name, birthday_date FROM birthdays WHERE chat_id = ? AND {where}"
+    params = [chat_id] + ([today] if uses_today else [])
+    sign = "<" if descending else ">"
+    if after is not None:
+        if uses_today:
+            query += f" AND (birthday_md, id) {sign} (?, ?)"
+            params += after
+        else:
+            query += f" AND id {sign} ?"
+            params.append(after[1])
+    order = " DESC" if descending else ""
+    query += f" ORDER BY birthday_md{order}, id{order} LIMIT ?"
+    params.append(limit)
+    return db.fetchall(query, params)
+
+
+def _walk(db, chat_id, today, cursor, descending, limit):
+    rows = []
+    first = cursor[0] if cursor else (len(SEGMENTS) - 1 if descending else 0)
+    segments = range(first, -1, -1) if descending else range(first, len(SEGMENTS))
+    for segment in segments:
+        after = cursor[1:] if cursor and segment == cursor[0] else None
+        for md, row_id, name, date in _segment_rows(db, chat_id, today, segment, after, descending, limit - len(rows)):
+            rows.append((segment, md, row_id, name, date))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def birthdays_page(db, chat_id, today, cursor=None, backwards=False, size=20):
+    # Keyset-пагинация: страница начинается после (или перед) ключом (сегмент, ММ-ДД, id) последней показанной
+    # строки, поэтому на каждую страницу читаем не больше size + 1 строк, сколько бы дней рождения ни было в чате
+    rows = _walk(db, chat_id, today, cursor, backwards, size + 1)
+    more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+        return rows, more, True
+    return rows, cursor is not None, more
+
+
+def encode_cursor(chat_id, today, direction, row):
+    segment, md, row_id = row[:3]
+    return f"bd:{chat_id}:{today}:{direction}:{segment}:{md or ''}:{row_id}"
+
+
+def decode_cursor(data):
+    _, chat_id, today, direction, segment, md, row_id = data.split(":")
+    return int(chat_id), today, direction == "p", (int(segment), md or None, int(row_id))
+
+
+def birthday_keys(day):
+    keys = [day.strftime("%m-%d")]
+    # В невисокосный год родившиеся 29 февраля празднуют 28-го
+    if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+        keys.append("02-29")
+    return keys
+
+
+def get_birthdays(db, chat_ids, day):
+    keys = birthday_keys(day)
+    due = set(chat_ids)
+    rows = db.fetchall(f"SELECT chat_id, name FROM birthdays WHERE birthday_md IN ({', '.join('?' * len(keys))}) "
+                       "ORDER BY id", keys)
+    birthdays = {}
+    for chat_id, name in rows:
+        if chat_id in due:
+            birthdays.setdefault(chat_id, []).append(name)
+    return birthdays
+
+
+def birthday_message(birthdays):
+    if not birthdays:
+        return "Доброе утро!😺"
+    if len(birthdays) == 1:
+        return f"Сегодня {birthdays[0]} празднует день рождения! 😺🎉\nПоздравляем!"
+    if len(birthdays) == 2:
+        return f"Сегодня {birthdays[0]} и {birthdays[1]} празднуют день рождения! 😺🎉\nПоздравляем!🥳"
+    message = "Сегодня дни рождения у:\n"
+    for name in birthdays:
+        message += f"🎂 {name}\n"
+    return message + "Поздравляем всех именинников!😺🎉"
@@ -0,0 +1,163 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        # Меньше одного токена ведро не накопит никогда, и acquire крутился бы вечно
+        self.capacity = max(1, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = Lock()
+
+    def pause(self, seconds):
+        # После 429 Telegram ждёт retry_after от всего бота, а не только от одного чата
+        with self.lock:
+            until = time.monotonic() + seconds
+            if until > self.paused_until:
+                self.paused_until = until
+                self.tokens = 0
+                self.updated = until
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ChatLimiter:
+    # Telegram не даёт писать в один чат чаще раза в секунду, а после 429 — раньше retry_after
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.next_allowed = {}
+        self.lock = Lock()
+
+    def wait(self, chat_id):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                allowed = self.next_allowed.get(chat_id, 0)
+                if allowed <= now:
+                    self.next_allowed[chat_id] = now + self.interval
+                    return
+                wait = allowed - now
+            time.sleep(wait)
+
+    def defer(self, chat_id, seconds):
+        with self.lock:
+            self.next_allowed[chat_id] = max(self.next_allowed.get(chat_id, 0), time.monotonic() + seconds)
+
+
+class BroadcastStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = {}
+        self.latencies = []
+        self.started = time.monotonic()
+        self.finished = None
+        self.lock = Lock()
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"отправлено {self.sent}, ошибок {self.failed}, повторов {self.retries}, 429: {self.throttled}, "
+                f"{self.elapsed:.1f} с, {self.throughput:.1f} сообщ/с, "
+                f"задержка p50 {self.percentile(50) * 1000:.0f} мс, p99 {self.percentile(99) * 1000:.0f} мс")
+
+
+def retry_delay(error, attempt, backoff):
+    code = getattr(error, 'error_code', None) or getattr(getattr(error, 'result', None), 'status_code', None)
+    if code == 429:
+        parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+        return parameters.get('retry_after', backoff * 2 ** attempt)
+    # Сетевые ошибки (в т.ч. из requests) и 5xx считаем временными, остальные 4xx — нет
+    if (code is not None and code >= 500) or isinstance(error, OSError):
+        return backoff * 2 ** attempt
+    return None
+
+
+class Broadcaster:
+    def __init__(self, workers=8, rate=30, chat_interval=1.0, max_retries=3, backoff=1.0):
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.chats = ChatLimiter(chat_interval)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _deliver(self, chat_id, send, stats, on_sent):
+        attempt = 0
+        while True:
+            self.chats.wait(chat_id)
+            self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                result = send(chat_id)
+            except Exception as e:
+                delay = retry_delay(e, attempt, self.backoff)
+                if getattr(e, 'error_code', None) == 429:
+                    # retry_after относится ко всему боту: держим остальные отправки, даже если этот чат уже не повторим
+                    self.bucket.pause(delay)
+                with stats.lock:
+                    if getattr(e, 'error_code', None) == 429:
+                        stats.throttled += 1
+                    if delay is None or attempt >= self.max_retries:
+                        stats.failed += 1
+                        code = getattr(e, 'error_code', None) or type(e).__name__
+                        stats.errors[code] = stats.errors.get(code, 0) + 1
+                    else:
+                        stats.retries += 1
+                if delay is None or attempt >= self.max_retries:
+                    logger.warning(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    return None
+                self.chats.defer(chat_id, delay)
+                attempt += 1
+                continue
+            with stats.lock:
+                stats.sent += 1
+                stats.latencies.append(time.monotonic() - started)
+            if on_sent:
+                # Учёт после отправки не повторяем и не считаем ошибкой отправки: сообщение уже доставлено
+                try:
+                    on_sent(chat_id, result)
+                except Exception as e:
+                    logger.exception(f"Сообщение в чат {chat_id} отправлено, но не учтено: {e}")
+            return result
+
+    def run(self, chat_ids, send, stats=None, on_sent=None):
+        stats = stats or BroadcastStats()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for chat_id in chat_ids:
+                executor.submit(self._deliver, chat_id, send, stats, on_sent)
+        stats.finished = time.monotonic()
+        return stats
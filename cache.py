@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class TTLCache(LRUCache):
+    def __init__(self, maxsize=256, ttl=3600):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or item[1] <= time.monotonic():
+                self.data.pop(key, None)
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value):
+        super().set(key, (value, time.monotonic() + self.ttl))
+
+
+class ChatInfoCache:
+    # Данные о боте и чатах почти не меняются: берём их из памяти, а не запрашиваем у Telegram в каждом обработчике
+    def __init__(self, bot, db, ttl=3600, maxsize=10000):
+        self.bot = bot
+        self.db = db
+        self.chats = TTLCache(maxsize, ttl)
+        self.me = None
+        self.api_calls = 0
+        self.saved_calls = 0
+        self.lock = Lock()
+
+    def _count(self, saved):
+        with self.lock:
+            if saved:
+                self.saved_calls += 1
+            else:
+                self.api_calls += 1
+
+    def get_me(self):
+        if self.me is None:
+            self.me = self.bot.get_me()
+            self._count(False)
+        else:
+            self._count(True)
+        return self.me
+
+    def get_chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is not None:
+            self._count(True)
+            return chat
+        chat = self.bot.get_chat(chat_id)
+        self._count(False)
+        self.remember(chat)
+        return chat
+
+    def remember(self, chat):
+        cached = self.chats.get(chat.id)
+        self.chats.set(chat.id, chat)
+        if chat.title and (cached is None or cached.title != chat.title):
+            self.db.execute("UPDATE chats SET title = ? WHERE chat_id = ?", (chat.title, chat.id))
+
+    def __str__(self):
+        return f"запросов к API: {self.api_calls}, сэкономлено: {self.saved_calls}, чатов в кэше: {len(self.chats)}"
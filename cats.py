@@ -0,0 +1,95 @@
+import logging
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CAT_API_URL = 'https://api.thecatapi.com/v1/images/search'
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    def __init__(self, failures=3, reset_timeout=60):
+        self.max_failures = failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # После паузы пропускаем пробный запрос: удачный закроет цепь, неудачный снова её откроет
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+
+class CatPool:
+    # Котиков загружаем заранее в фоне, рассылка берёт готовую ссылку и никогда не ждёт сеть
+    def __init__(self, url=CAT_API_URL, size=10, timeout=(3, 10), interval=60):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self.interval = interval
+        self.urls = deque(maxlen=size)
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=2, max_retries=1))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=2, max_retries=1))
+        self.wanted = Event()
+        self.stopped = False
+        self.thread = None
+
+    def get(self):
+        try:
+            url = self.urls.popleft()
+        except IndexError:
+            url = None
+        self.wanted.set()
+        return url
+
+    def fetch(self):
+        response = self.session.get(self.url, params={'limit': self.size}, timeout=self.timeout)
+        response.raise_for_status()
+        return [image['url'] for image in response.json() if image.get('url')]
+
+    def fill(self):
+        while len(self.urls) < self.size and self.breaker.allow():
+            try:
+                urls = self.fetch()
+            except Exception as e:
+                self.breaker.failure()
+                logger.warning(f"Ошибка при загрузке котика: {e}")
+                return
+            self.breaker.success()
+            if not urls:
+                return
+            self.urls.extend(urls[:self.size - len(self.urls)])
+
+    def run(self):
+        while not self.stopped:
+            self.wanted.clear()
+            self.fill()
+            self.wanted.wait(self.interval)
+
+    def start(self):
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wanted.set()
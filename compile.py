@@ -14,6 +14,7 @@ params = [
     "--hidden-import=apscheduler",
     "--hidden-import=apscheduler.schedulers",
     "--hidden-import=apscheduler.schedulers.background",
+    "--hidden-import=apscheduler.jobstores.sqlalchemy",
     bot_script
 ]
 
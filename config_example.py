@@ -9,4 +9,56 @@ TIME_FORMAT = '%H:%M' # Пример: 09:30
 
 DB_NAME = "bot.db"
 
+DB_POOL_SIZE = 5 # Сколько соединений с базой держать открытыми
+
+PHOTO_NO_REPEATS = False # True — каждый чат получает фото без повторов, пока не увидит все
+
+CAT_API_URL = 'https://api.thecatapi.com/v1/images/search' # Откуда брать котиков, если своих фото нет
+
+CAT_POOL_SIZE = 10 # Сколько ссылок на котиков держать про запас
+
+MEDIA_CACHE_SIZE = 1000 # Сколько загруженных в Telegram котиков помнить, чтобы не отправлять их по ссылке
+
+STATE_BACKEND = "memory" # "sqlite" — незавершённые действия пользователей переживут перезапуск
+
+STATE_TTL = 3600 # Через сколько секунд забывать незавершённое действие
+
+STATE_MAX_USERS = 10000 # Сколько пользователей с незавершёнными действиями помнить
+
+CHAT_CACHE_TTL = 3600 # Сколько секунд помнить названия и типы чатов, не спрашивая Telegram
+
+MAILING_GRACE_MINUTES = 60 # Сколько минут после времени рассылки её ещё можно догнать (после перезапуска или сбоя)
+
+MAILING_LEASE_MINUTES = 10 # Если бот упал посреди рассылки, неотправленные чаты catch-up повторит не раньше чем через столько минут (плюс время самой рассылки)
+
+MAILING_WORKERS = 8 # Сколько чатов рассылка обслуживает параллельно
+
+MAILING_RATE = 30 # Общий лимит сообщений в секунду (ограничение Telegram)
+
+MAILING_PROCESSES = 1 # Больше 1 — рассылку делят между столькими процессами, лимит MAILING_RATE общий на всех
+
+WEBHOOK_URL = None # Например "https://example.com" — бот получает обновления через вебхук вместо опроса
+
+WEBHOOK_HOST = "0.0.0.0" # Где слушать вебхук
+
+WEBHOOK_PORT = 8443 # Без WEBHOOK_CERT вебхук работает по HTTP, снаружи нужен прокси с HTTPS (см. README)
+
+WEBHOOK_CERT = None # Путь к сертификату (PEM), чтобы бот сам принимал HTTPS; самоподписанный тоже подойдёт
+
+WEBHOOK_KEY = None # Путь к закрытому ключу сертификата
+
+WEBHOOK_SECRET = None # Секрет, который Telegram присылает в заголовке каждого запроса; если не задан, бот придумывает новый при каждом запуске
+
+WEBHOOK_WORKERS = 4 # Сколько потоков обрабатывают обновления (порядок внутри одного чата сохраняется)
+
+WEBHOOK_QUEUE_SIZE = 1000 # Размер очереди каждого потока; при переполнении Telegram повторит доставку позже
+
+LOG_LEVEL = "INFO"
+
+LOG_JSON = False # True — журнал пишется строками JSON (удобно собирать в Loki/ELK)
+
+METRICS_PORT = None # Например 9100 — метрики в формате Prometheus на http://METRICS_HOST:9100/metrics
+
+METRICS_HOST = "127.0.0.1"
+
 # Перед запуском переименовать этот файл в config.py
@@ -0,0 +1,83 @@
+import sqlite3 as sql
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from threading import Lock
+
+from metrics import registry
+
+
+class ConnectionPool:
+    # Долгоживущие соединения с SQLite, общие для потока опроса, планировщика и рассылки
+    def __init__(self, path, size=5, timeout=30.0, busy_timeout=5000, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.idle = LifoQueue()
+        self.opened = 0
+        self.lock = Lock()
+
+    def _open(self):
+        con = sql.connect(self.path, timeout=self.busy_timeout / 1000, check_same_thread=False,
+                          cached_statements=self.cached_statements)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self.opened -= 1
+                    raise
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except Empty:
+            raise sql.OperationalError(f"Нет свободных соединений с базой за {self.timeout} с")
+
+    @contextmanager
+    def connection(self, op="connection"):
+        # Ожидание свободного соединения показывает, хватает ли размера пула, а время работы с соединением вместе с
+        # коммитом попадает в db_query_seconds с меткой op — и для помощников ниже, и для прямых вызовов
+        with registry.timer("db_wait_seconds"):
+            con = self._acquire()
+        try:
+            with registry.timer("db_query_seconds", op=op), con:
+                yield con
+        finally:
+            self.idle.put(con)
+
+    def execute(self, query, params=()):
+        with self.connection("execute") as con:
+            return con.execute(query, params).rowcount
+
+    def executemany(self, query, rows):
+        with self.connection("executemany") as con:
+            return con.executemany(query, rows).rowcount
+
+    def fetchone(self, query, params=()):
+        with self.connection("fetchone") as con:
+            return con.execute(query, params).fetchone()
+
+    def fetchall(self, query, params=()):
+        with self.connection("fetchall") as con:
+            return con.execute(query, params).fetchall()
+
+    def close(self):
+        while True:
+            try:
+                con = self.idle.get_nowait()
+            except Empty:
+                break
+            con.close()
+            with self.lock:
+                self.opened -= 1
@@ -0,0 +1,89 @@
+import logging
+import time
+from itertools import groupby
+from threading import Condition, Thread
+
+from broadcast import retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+def create_deletions_table(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS pending_deletions (
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        delete_at REAL NOT NULL,
+        PRIMARY KEY (chat_id, message_id)
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_deletions_due ON pending_deletions (delete_at)")
+
+
+class DeletionScheduler:
+    # Отложенные удаления лежат в SQLite, а не в спящих потоках: один рабочий поток, память не растёт
+    # с числом ожидающих удалений, и после перезапуска ничего не теряется
+    def __init__(self, db, delete, batch_size=100, retry_backoff=60):
+        self.db = db
+        self.delete = delete
+        self.batch_size = batch_size
+        self.retry_backoff = retry_backoff
+        self.wakeup = Condition()
+        self.next_due = None
+        self.stopped = False
+        self.thread = None
+
+    def schedule(self, chat_id, message_id, delay):
+        delete_at = time.time() + delay
+        self.db.execute("INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, delete_at) VALUES (?, ?, ?)",
+                        (chat_id, message_id, delete_at))
+        with self.wakeup:
+            if self.next_due is None or delete_at < self.next_due:
+                self.next_due = delete_at
+                self.wakeup.notify()
+
+    def start(self):
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.wakeup:
+            self.stopped = True
+            self.wakeup.notify()
+
+    def run(self):
+        while True:
+            with self.wakeup:
+                if self.stopped:
+                    return
+                self.next_due = self.db.fetchone("SELECT MIN(delete_at) FROM pending_deletions")[0]
+                now = time.time()
+                if self.next_due is None or self.next_due > now:
+                    self.wakeup.wait(None if self.next_due is None else self.next_due - now)
+                    continue
+            try:
+                self.flush(now)
+            except Exception as e:
+                logger.error(f"Ошибка при удалении сообщений: {e}")
+                time.sleep(1)
+
+    def flush(self, now):
+        rows = self.db.fetchall("SELECT chat_id, message_id FROM pending_deletions WHERE delete_at <= ? "
+                                "ORDER BY chat_id LIMIT ?", (now, self.batch_size * 10))
+        for chat_id, group in groupby(rows, key=lambda row: row[0]):
+            message_ids = [row[1] for row in group]
+            # deleteMessages принимает до 100 сообщений одного чата за раз
+            for i in range(0, len(message_ids), self.batch_size):
+                batch = message_ids[i:i + self.batch_size]
+                try:
+                    self.delete(chat_id, batch)
+                except Exception as e:
+                    # Сеть и 5xx — временные ошибки, как в рассылке: удаление откладываем, а не теряем.
+                    # Остальные 4xx (сообщение уже удалено или старше 48 часов) не пройдут и при повторе
+                    delay = retry_delay(e, 0, self.retry_backoff)
+                    if delay is not None:
+                        logger.warning(f"Ошибка при удалении сообщений в чате {chat_id}, повтор через {delay} с: {e}")
+                        self.db.executemany("UPDATE pending_deletions SET delete_at = ? WHERE chat_id = ? AND message_id = ?",
+                                            [(now + delay, chat_id, message_id) for message_id in batch])
+                        continue
+                    logger.warning(f"Ошибка при удалении сообщения: {e}")
+                self.db.executemany("DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?",
+                                    [(chat_id, message_id) for message_id in batch])
@@ -0,0 +1,106 @@
+import time
+from datetime import datetime, timedelta
+
+
+def create_deliveries_table(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS deliveries (
+        chat_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        updated_at REAL NOT NULL,
+        lease_owner TEXT,
+        lease_until REAL,
+        PRIMARY KEY (chat_id, date)
+    )""")
+    # Журнал из прошлой версии: без аренды, которую используют процессы рассылки
+    c.execute("PRAGMA table_info(deliveries)")
+    if "lease_owner" not in [row[1] for row in c.fetchall()]:
+        c.execute("ALTER TABLE deliveries ADD COLUMN lease_owner TEXT")
+        c.execute("ALTER TABLE deliveries ADD COLUMN lease_until REAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_date ON deliveries (date, status)")
+
+
+def last_occurrence(slot, now, time_format):
+    # Последний момент рассылки slot, не позже now: для 23:30 в 00:10 это вчерашние 23:30
+    slot_time = datetime.strptime(slot, time_format)
+    occurrence = now.replace(hour=slot_time.hour, minute=slot_time.minute, second=0, microsecond=0)
+    if occurrence > now:
+        occurrence -= timedelta(days=1)
+    return occurrence
+
+
+class DeliveryLedger:
+    # Журнал рассылок: не больше одного утреннего сообщения в чат за день, даже если слот запустился дважды
+    # или его догоняет catch-up после перезапуска
+    def __init__(self, db, clock=datetime.now, max_attempts=3):
+        self.db = db
+        self.clock = clock
+        self.max_attempts = max_attempts
+
+    def claim(self, chat_ids, day, lease_seconds=600):
+        # Захват живёт lease_seconds: если процесс (основной или процесс рассылки) упал посреди рассылки, не дойдя
+        # до mark_unsent_failed, после истечения аренды чат снова можно захватить
+        if not chat_ids:
+            return []
+        now = time.time()
+        done = {row[0] for row in self.db.fetchall(
+            "SELECT chat_id FROM deliveries WHERE date = ? AND (attempts >= ? OR status = 'sent' OR status = 'queued' "
+            "OR (status = 'sending' AND lease_until >= ?))",
+            (day, self.max_attempts, now))}
+        pending = [chat_id for chat_id in chat_ids if chat_id not in done]
+        claimed = []
+        with self.db.connection("ledger_claim") as con:
+            for chat_id in pending:
+                cursor = con.execute("""INSERT INTO deliveries (chat_id, date, status, attempts, updated_at, lease_until)
+                    VALUES (?, ?, 'sending', 1, ?, ?)
+                    ON CONFLICT (chat_id, date) DO UPDATE SET
+                        status = 'sending', attempts = attempts + 1, updated_at = excluded.updated_at,
+                        lease_owner = NULL, lease_until = excluded.lease_until
+                    WHERE attempts < ? AND (status = 'failed'
+                        OR (status = 'sending' AND (lease_until IS NULL OR lease_until < ?)))""",
+                                     (chat_id, day, now, now + lease_seconds, self.max_attempts, now))
+                if cursor.rowcount:
+                    claimed.append(chat_id)
+        return claimed
+
+    def enqueue(self, chat_ids, day, run_id):
+        # Захваченные чаты отдаём процессам рассылки: они разбирают очередь run_id через lease
+        self.db.executemany("UPDATE deliveries SET status = 'queued', lease_owner = ?, lease_until = NULL "
+                            "WHERE chat_id = ? AND date = ? AND status = 'sending'",
+                            [(run_id, chat_id, day) for chat_id in chat_ids])
+
+    def lease(self, run_id, owner, day, limit, lease_seconds):
+        # Процесс забирает пачку чатов своей рассылки (run_id), поставленных в очередь или брошенных процессом, чья
+        # аренда истекла. Запись в SQLite идёт по одной, поэтому один чат не достанется двум процессам сразу
+        now = time.time()
+        until = now + lease_seconds
+        with self.db.connection("ledger_lease") as con:
+            con.execute("""UPDATE deliveries SET status = 'sending', lease_owner = ?, lease_until = ?, updated_at = ?
+                WHERE rowid IN (SELECT rowid FROM deliveries WHERE date = ? AND (
+                    (status = 'queued' AND lease_owner = ?) OR
+                    (status = 'sending' AND lease_owner LIKE ? AND lease_until < ?)
+                ) LIMIT ?)""", (owner, until, now, day, run_id, run_id + "/%", now, limit))
+            rows = con.execute("SELECT chat_id FROM deliveries WHERE date = ? AND status = 'sending' "
+                               "AND lease_owner = ? AND lease_until = ?", (day, owner, until)).fetchall()
+        return [row[0] for row in rows]
+
+    def release_expired(self, run_id, day):
+        # Чаты процессов рассылки run_id, чья аренда истекла, а отметки об отправке нет: процесс упал
+        return self.db.execute("UPDATE deliveries SET status = 'failed', updated_at = ? WHERE date = ? "
+                               "AND status = 'sending' AND lease_owner LIKE ? AND lease_until < ?",
+                               (time.time(), day, run_id + "/%", time.time()))
+
+    def mark_sent(self, chat_id, day):
+        self.db.execute("UPDATE deliveries SET status = 'sent', updated_at = ? WHERE chat_id = ? AND date = ?",
+                        (time.time(), chat_id, day))
+
+    def mark_unsent_failed(self, chat_ids, day, status='sending'):
+        now = time.time()
+        self.db.executemany("UPDATE deliveries SET status = 'failed', updated_at = ? "
+                            "WHERE chat_id = ? AND date = ? AND status = ?",
+                            [(now, chat_id, day, status) for chat_id in chat_ids])
+
+    def prune(self, keep_days=7):
+        day = (self.clock() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+        self.db.execute("DELETE FROM deliveries WHERE date < ?", (day,))
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import json
+import sys
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+BIRTHDAY_FIELDS = ("chat_id", "name", "birthday_date")
+CHAT_FIELDS = ("chat_id", "title", "is_active", "mailing_time")
+EXPORT_QUERIES = {
+    "birthdays": "SELECT chat_id, name, birthday_date FROM birthdays ORDER BY id",
+    "chats": "SELECT chat_id, title, is_active, mailing_time FROM chats ORDER BY chat_id",
+}
+
+
+def create_birthdays_unique_index(c):
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_birthdays_unique'")
+    if c.fetchone():
+        return
+    # В старых базах могли накопиться одинаковые записи, оставляем самую раннюю
+    c.execute("""DELETE FROM birthdays WHERE id NOT IN (
+        SELECT MIN(id) FROM birthdays GROUP BY chat_id, name, birthday_date
+    )""")
+    c.execute("CREATE UNIQUE INDEX idx_birthdays_unique ON birthdays (chat_id, name, birthday_date)")
+
+
+def file_format(filename):
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+
+def read_rows(stream, fmt):
+    # Файл читаем построчно, целиком в памяти он не держится. JSON — по объекту на строку (JSON Lines)
+    if fmt == "csv":
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row
+        return
+    for line, text in enumerate(stream, start=1):
+        if text.strip():
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                yield line, e
+
+
+class ImportReport:
+    def __init__(self, max_errors=50):
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def error(self, line, text):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"строка {line}: {text}")
+
+    def __str__(self):
+        text = f"Добавлено: {self.inserted}, дубликатов пропущено: {self.duplicates}, ошибок: {self.failed}"
+        if self.errors:
+            text += "\n" + "\n".join(self.errors)
+            if self.failed > len(self.errors):
+                text += f"\n… и ещё {self.failed - len(self.errors)}"
+        return text
+
+
+def _import(db, rows, parse, query, batch_size, report):
+    while True:
+        batch = []
+        for line, row in islice(rows, batch_size):
+            try:
+                if isinstance(row, Exception):
+                    raise ValueError(f"неверный JSON ({row})")
+                batch.append(parse(row))
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                report.error(line, e)
+        if not batch:
+            break
+        with db.connection("import_batch") as con:
+            inserted = con.executemany(query, batch).rowcount
+        report.inserted += inserted
+        report.duplicates += len(batch) - inserted
+    return report
+
+
+def import_birthdays(db, stream, fmt, date_format, batch_size=5000):
+    known_chats = {row[0] for row in db.fetchall("SELECT chat_id FROM chats")}
+    report = ImportReport()
+
+    # strptime — самое дорогое в разборе строки, а различных дат в файле гораздо меньше, чем строк
+    @lru_cache(maxsize=65536)
+    def parse_date(text):
+        try:
+            birth_date = datetime.strptime(text, date_format)
+        except ValueError:
+            raise ValueError(f"дата не в формате {date_format.replace('%', '')}")
+        return birth_date.strftime(date_format), birth_date.strftime("%m-%d")
+
+    def parse(row):
+        chat_id = int(row["chat_id"])
+        name = str(row["name"]).strip()
+        if not name:
+            raise ValueError("пустое имя")
+        birthday_date, birthday_md = parse_date(str(row["birthday_date"]).strip())
+        if chat_id not in known_chats:
+            raise ValueError(f"чат {chat_id} не найден, сначала добавьте его")
+        return chat_id, name, birthday_date, birthday_md
+
+    _import(db, read_rows(stream, fmt), parse,
+            "INSERT OR IGNORE INTO birthdays (chat_id, name, birthday_date, birthday_md) VALUES (?, ?, ?, ?)",
+            batch_size, report)
+    return report
+
+
+def import_chats(db, stream, fmt, time_format, batch_size=5000):
+    report = ImportReport()
+
+    def parse(row):
+        mailing_time = str(row.get("mailing_time") or "09:00").strip()
+        datetime.strptime(mailing_time, time_format)
+        # 0 и False — выключенный чат, по умолчанию активен только чат без значения
+        is_active = row.get("is_active")
+        is_active = 1 if is_active is None or str(is_active).strip() == "" else int(is_active)
+        return int(row["chat_id"]), row.get("title"), is_active, mailing_time
+
+    _import(db, read_rows(stream, fmt), parse,
+            "INSERT OR IGNORE INTO chats (chat_id, title, is_active, mailing_time) VALUES (?, ?, ?, ?)",
+            batch_size, report)
+    return report
+
+
+def export_table(db, table, stream, fmt, batch_size=5000):
+    fields = BIRTHDAY_FIELDS if table == "birthdays" else CHAT_FIELDS
+    writer = csv.writer(stream) if fmt == "csv" else None
+    if writer:
+        writer.writerow(fields)
+    count = 0
+    with db.connection("export") as con:
+        cursor = con.execute(EXPORT_QUERIES[table])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    stream.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n")
+            count += len(rows)
+    return count
+
+
+if __name__ == "__main__":
+    # python import_export.py import birthdays birthdays.csv
+    # python import_export.py export chats chats.jsonl
+    # Чаты, загруженные при работающем боте, попадут в рассылку после его перезапуска
+    import config
+    from db import ConnectionPool
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("table", choices=["birthdays", "chats"])
+    parser.add_argument("file", help="файл .csv или .jsonl, «-» — stdin/stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--db", default=config.DB_NAME)
+    args = parser.parse_args()
+    fmt = args.format or file_format(args.file)
+    db = ConnectionPool(args.db)
+    if args.action == "import":
+        stream = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="")
+        with stream:
+            if args.table == "birthdays":
+                with db.connection("import_index") as con:
+                    create_birthdays_unique_index(con.cursor())
+                print(import_birthdays(db, stream, fmt, config.DATE_FORMAT))
+            else:
+                print(import_chats(db, stream, fmt, config.TIME_FORMAT))
+    else:
+        stream = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8", newline="")
+        with stream:
+            count = export_table(db, args.table, stream, fmt)
+        print(f"Выгружено строк: {count}", file=sys.stderr)
+    db.close()
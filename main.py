@@ -1,24 +1,82 @@
-import sqlite3 as sql
-from datetime import datetime
-from threading import Thread
+import io
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from multiprocessing import freeze_support
+from threading import Thread, Lock
 import time
+from uuid import uuid4
 import telebot
 from telebot import types
 from apscheduler.schedulers.background import BackgroundScheduler
-import requests
 import config
+from birthdays import (birthday_message, birthdays_page, create_birthdays_list_index, decode_cursor, encode_cursor,
+                       get_birthdays)
+from broadcast import Broadcaster
+from cache import ChatInfoCache
+from cats import CAT_API_URL, CatPool
+from db import ConnectionPool
+from deliveries import DeliveryLedger, create_deliveries_table, last_occurrence
+from deletions import DeletionScheduler, create_deletions_table
+from import_export import create_birthdays_unique_index, export_table, file_format, import_birthdays
+from metrics import MetricsServer, SamplingProfiler, registry, setup_logging
+from photos import (CaptionIndex, MediaCache, PhotoPool, create_caption_folded, create_media_cache_table, create_photo_fts,
+                    fold_caption)
+from shards import run_shards
+from states import MemoryStateStore, SQLiteStateStore, create_states_table
+from webhook import run_webhook
 
-bot = telebot.TeleBot(config.BOT_TOKEN)
+logger = logging.getLogger("bot")
+webhook_url = getattr(config, 'WEBHOOK_URL', None)
+# В режиме вебхука обновления раскладывает по потокам UpdateDispatcher, собственный пул telebot не нужен
+bot = telebot.TeleBot(config.BOT_TOKEN, threaded=not webhook_url)
+db = ConnectionPool(config.DB_NAME, size=getattr(config, 'DB_POOL_SIZE', 5))
 admin_ids = config.ADMIN_IDS
-user_states = {}
+mailing_grace = timedelta(minutes=getattr(config, 'MAILING_GRACE_MINUTES', 60))
+mailing_lease = timedelta(minutes=getattr(config, 'MAILING_LEASE_MINUTES', 10))
+try:
+    # Задачи планировщика храним в той же базе, чтобы пропущенный из-за перезапуска запуск выполнился после старта
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    jobstores = {'default': SQLAlchemyJobStore(url=f"sqlite:///{config.DB_NAME}")}
+except ImportError:
+    logger.warning("SQLAlchemy не установлен, задачи планировщика хранятся в памяти")
+    jobstores = {}
+scheduler = BackgroundScheduler(jobstores=jobstores, job_defaults={
+    'coalesce': True, 'misfire_grace_time': int(mailing_grace.total_seconds())})
+ledger = DeliveryLedger(db)
+mailing_schedule = {}
+schedule_lock = Lock()
+photo_pool = PhotoPool(db, no_repeats=getattr(config, 'PHOTO_NO_REPEATS', False))
+caption_index = CaptionIndex(db)
+media_cache = MediaCache(db, maxsize=getattr(config, 'MEDIA_CACHE_SIZE', 1000))
+chat_info_cache = ChatInfoCache(bot, db, ttl=getattr(config, 'CHAT_CACHE_TTL', 3600))
+cat_pool = CatPool(getattr(config, 'CAT_API_URL', CAT_API_URL), size=getattr(config, 'CAT_POOL_SIZE', 10))
+mailing_rate = getattr(config, 'MAILING_RATE', 30)
+mailing_processes = getattr(config, 'MAILING_PROCESSES', 1)
+broadcaster = Broadcaster(workers=getattr(config, 'MAILING_WORKERS', 8), rate=mailing_rate)
+last_mailing = None
+# /profile_mailing: следующая рассылка пройдёт под профилировщиком, отчёт уйдёт в этот чат
+profile_chat = None
+profile_lock = Lock()
+registry.gauge("mailing_slots", lambda: len(mailing_schedule))
+registry.gauge("cat_pool_size", lambda: len(cat_pool.urls))
+registry.gauge("caption_cache_hits", lambda: caption_index.cache.hits)
+registry.gauge("caption_cache_misses", lambda: caption_index.cache.misses)
+registry.gauge("chat_cache_api_calls", lambda: chat_info_cache.api_calls)
+registry.gauge("chat_cache_saved_calls", lambda: chat_info_cache.saved_calls)
+if getattr(config, 'STATE_BACKEND', 'memory') == 'sqlite':
+    user_states = SQLiteStateStore(db, ttl=getattr(config, 'STATE_TTL', 3600), maxsize=getattr(config, 'STATE_MAX_USERS', 10000))
+else:
+    user_states = MemoryStateStore(ttl=getattr(config, 'STATE_TTL', 3600), maxsize=getattr(config, 'STATE_MAX_USERS', 10000))
 
 def init_db():
-    with sql.connect(config.DB_NAME) as con:
+    with db.connection("init_db") as con:
         c = con.cursor()
         c.execute("""CREATE TABLE IF NOT EXISTS birthdays (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             birthday_date TEXT NOT NULL,
+            birthday_md TEXT,
             chat_id INTEGER,
             FOREIGN KEY (chat_id) REFERENCES chats (chat_id) ON DELETE CASCADE
         )""")
@@ -26,7 +84,8 @@ def init_db():
         c.execute("""CREATE TABLE IF NOT EXISTS photo (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             file_id TEXT NOT NULL,
-            caption TEXT DEFAULT "Нет подписи"
+            caption TEXT DEFAULT "Нет подписи",
+            caption_folded TEXT
         )""")
         
         c.execute("""CREATE TABLE IF NOT EXISTS chats (
@@ -36,107 +95,244 @@ def init_db():
             mailing_time TEXT DEFAULT "09:00"
         )""")
         
+        migrate_birthday_md(c)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_md ON birthdays (birthday_md, chat_id)")
+        # Поиск по подписи идёт через caption_folded, индекс по caption из прошлых версий только замедляет запись
+        c.execute("DROP INDEX IF EXISTS idx_photo_caption")
+        create_caption_folded(c)
+        create_photo_fts(c)
+        create_deletions_table(c)
+        create_media_cache_table(c)
+        create_states_table(c)
+        create_birthdays_unique_index(c)
+        create_birthdays_list_index(c)
+        create_deliveries_table(c)
 
-init_db()
+def migrate_birthday_md(c):
+    # Старые базы: день и месяц хранились только внутри birthday_date, выносим их в отдельный столбец ММ-ДД
+    c.execute("PRAGMA table_info(birthdays)")
+    if "birthday_md" in [row[1] for row in c.fetchall()]:
+        return
+    c.execute("ALTER TABLE birthdays ADD COLUMN birthday_md TEXT")
+    c.execute("SELECT id, birthday_date FROM birthdays")
+    updates = []
+    for row_id, birthday_date in c.fetchall():
+        try:
+            updates.append((datetime.strptime(birthday_date, config.DATE_FORMAT).strftime("%m-%d"), row_id))
+        except ValueError:
+            logger.warning(f"Не удалось разобрать дату {birthday_date} (id {row_id})")
+    c.executemany("UPDATE birthdays SET birthday_md = ? WHERE id = ?", updates)
+
+
+def delete_messages(chat_id, message_ids):
+    if len(message_ids) == 1:
+        bot.delete_message(chat_id, message_ids[0])
+    else:
+        bot.delete_messages(chat_id, message_ids)
+
+deletion_scheduler = DeletionScheduler(db, delete_messages)
 
 def delete_message(chat_id, message_id, delay=5):
-    def delete():
-        time.sleep(delay)
-        try:
-            bot.delete_message(chat_id, message_id)
-        except Exception as e:
-            print(f"Ошибка при удалении сообщения: {e}")
-    
-    Thread(target=delete).start()
+    deletion_scheduler.schedule(chat_id, message_id, delay)
 
 def get_random_cat():
-    try:
-        response = requests.get('https://api.thecatapi.com/v1/images/search')
-        if response.status_code == 200:
-            return response.json()[0]['url']
-        else:
-            return None
-    except Exception as e:
-        print(f"Ошибка при загрузке котика: {e}")
-        return None
+    # Если API котиков недоступно, повторяем уже загруженного в Telegram котика
+    return cat_pool.get() or media_cache.random_source()
+
+def load_mailing_schedule():
+    with db.connection("load_mailing_schedule") as con:
+        c = con.cursor()
+        c.execute("SELECT chat_id, mailing_time FROM chats WHERE is_active = 1")
+        rows = c.fetchall()
+    with schedule_lock:
+        mailing_schedule.clear()
+        for chat_id, mailing_time in rows:
+            mailing_schedule.setdefault(mailing_time, set()).add(chat_id)
+
+def schedule_chat(chat_id, mailing_time):
+    with schedule_lock:
+        for slot in list(mailing_schedule):
+            mailing_schedule[slot].discard(chat_id)
+            if not mailing_schedule[slot]:
+                del mailing_schedule[slot]
+        mailing_schedule.setdefault(mailing_time, set()).add(chat_id)
+    sync_mailing_jobs()
+
+def sync_mailing_jobs():
+    # Одна cron-задача на каждое занятое время рассылки, пустые минуты не будят планировщик
+    with schedule_lock:
+        slots = set(mailing_schedule)
+    for job in scheduler.get_jobs():
+        if job.id.startswith("mailing_") and job.id[len("mailing_"):] not in slots:
+            job.remove()
+    for slot in slots:
+        # Существующую задачу не перезаписываем: это сбросило бы пропущенный запуск из сохранённого расписания
+        if scheduler.get_job(f"mailing_{slot}"):
+            continue
+        mailing_time = datetime.strptime(slot, config.TIME_FORMAT)
+        scheduler.add_job(morning_mailing, 'cron', hour=mailing_time.hour, minute=mailing_time.minute,
+                          args=[slot], id=f"mailing_{slot}", replace_existing=True)
+
+def catch_up_mailings():
+    # Догоняем слоты, прошедшие не раньше чем mailing_grace назад: журнал пропустит уже получившие рассылку чаты
+    now = ledger.clock()
+    with schedule_lock:
+        slots = list(mailing_schedule)
+    for slot in slots:
+        slot_time = last_occurrence(slot, now, config.TIME_FORMAT)
+        if now - slot_time <= mailing_grace:
+            morning_mailing(slot, slot_time)
+    ledger.prune()
 
 def add_chat(chat_id, title, mailing_time="09:00"):
-    with sql.connect(config.DB_NAME) as con:
+    with db.connection("add_chat") as con:
         c = con.cursor()
         c.execute("INSERT OR IGNORE INTO chats (chat_id, title, mailing_time) VALUES (?, ?, ?)", 
                  (chat_id, title, mailing_time))
+        inserted = c.rowcount > 0
+    if inserted:
+        schedule_chat(chat_id, mailing_time)
 
-def get_chats_for_mailing():
-    current_time = datetime.now().strftime(config.TIME_FORMAT)
-    with sql.connect(config.DB_NAME) as con:
-        c = con.cursor()
-        c.execute("SELECT chat_id FROM chats WHERE is_active = 1 AND mailing_time = ?", (current_time,))
-        return [row[0] for row in c.fetchall()]
+def get_chats_for_mailing(mailing_time):
+    with schedule_lock:
+        return sorted(mailing_schedule.get(mailing_time, ()))
         
 def update_chat_mailing_time(chat_id, mailing_time):
-    with sql.connect(config.DB_NAME) as con:
+    with db.connection("update_chat_mailing_time") as con:
         c = con.cursor()
         c.execute("UPDATE chats SET mailing_time = ? WHERE chat_id = ?", (mailing_time, chat_id))
+        c.execute("SELECT is_active FROM chats WHERE chat_id = ?", (chat_id,))
+        row = c.fetchone()
+    if row and row[0]:
+        schedule_chat(chat_id, mailing_time)
         
-def get_random_photo():
+def get_random_photo(chat_id=None):
     try:
-        with sql.connect(config.DB_NAME) as con:
-            c = con.cursor()
-            c.execute("SELECT file_id FROM photo ORDER BY RANDOM() LIMIT 1")
-            result = c.fetchone()
-            return result[0] if result else None
+        return photo_pool.pick(chat_id)
     except Exception as e:
-        print(f"Ошибка при получении фото: {e}")
+        logger.exception(f"Ошибка при получении фото: {e}")
 
-def morning_mailing():
+def record_mailing(mailing_time, day, stats, elapsed):
+    global last_mailing
+    registry.observe("mailing_seconds", elapsed)
+    registry.inc("mailing_sent", stats.sent)
+    registry.inc("mailing_retries", stats.retries)
+    registry.inc("mailing_throttled", stats.throttled)
+    for code, count in stats.errors.items():
+        registry.inc("mailing_failed", count, code=code)
+    for latency in stats.latencies:
+        registry.observe("telegram_send_seconds", latency)
+    last_mailing = f"{mailing_time} за {day}: {stats}"
+    logger.info(f"Рассылка {last_mailing}", extra={'fields': {
+        'event': "mailing", 'slot': mailing_time, 'day': day, 'sent': stats.sent, 'failed': stats.failed,
+        'retries': stats.retries, 'throttled': stats.throttled, 'errors': stats.errors,
+        'seconds': round(elapsed, 3), 'p99_ms': round(stats.percentile(99) * 1000)}})
+
+def morning_mailing(mailing_time, slot_time=None):
+    global profile_chat
+    profiler = None
+    report_to = None
+    started = time.perf_counter()
+    chat_ids = []
+    delivered = set()
+    queued = set()
     try:
-        today = datetime.now().strftime("%d-%m")
-        random_photo = get_random_photo()
-        if not random_photo:
-            random_photo = get_random_cat()
-        
-        chat_ids = get_chats_for_mailing()
+        slot_time = slot_time or last_occurrence(mailing_time, ledger.clock(), config.TIME_FORMAT)
+        day = slot_time.strftime("%Y-%m-%d")
+        due = get_chats_for_mailing(mailing_time)
+        sharded = mailing_processes > 1 and len(due) > 1
+        # Аренда с запасом на всю рассылку при лимите MAILING_RATE: пока она не истекла, catch-up чаты не тронет
+        chat_ids = ledger.claim(due, day, mailing_lease.total_seconds() + len(due) / mailing_rate)
         
         if not chat_ids:
             return
+        with profile_lock:
+            if profile_chat is not None:
+                report_to, profile_chat = profile_chat, None
+                profiler = SamplingProfiler().start()
             
-        for chat_id in chat_ids:
+        birthdays_by_chat = get_birthdays(db, chat_ids, slot_time)
+        random_photo = get_random_photo()
+        cat_url = None
+        if not random_photo:
+            cat_url = get_random_cat()
+            if cat_url:
+                random_photo = media_cache.get(cat_url) or cat_url
+        
+        cat_chats = set()
+
+        def send_to_chat(chat_id):
+            # Только отправка: Broadcaster повторяет её при ошибке, поэтому учёт вынесен в after_send
+            photo = (photo_pool.no_repeats and get_random_photo(chat_id)) or random_photo
+            message = birthday_message(birthdays_by_chat.get(chat_id))
+            if photo:
+                if cat_url and photo is random_photo:
+                    cat_chats.add(chat_id)
+                return bot.send_photo(chat_id, photo, caption=message)
+            return bot.send_message(chat_id, message)
+
+        def after_send(chat_id, msg):
+            # Сбой здесь не делает доставленное сообщение неотправленным: чат уже в delivered и повторно не уйдёт
+            nonlocal random_photo
+            delivered.add(chat_id)
+            ledger.mark_sent(chat_id, day)
+            if chat_id in cat_chats:
+                if random_photo == cat_url:
+                    random_photo = media_cache.remember(cat_url, msg)
+                delete_message(chat_id, msg.message_id, 86400)
+
+        stats = None
+        first = []
+        if cat_url and random_photo == cat_url:
+            # Котика по ссылке сначала отправляем в один чат: Telegram скачает его один раз, остальным уйдёт file_id
+            first = chat_ids[:1]
+            stats = broadcaster.run(first, send_to_chat, on_sent=after_send)
+        rest = chat_ids[len(first):]
+        if sharded:
+            # Остальные чаты ставятся в очередь журнала под общим run_id, оттуда их разбирают процессы по аренде
+            run_id = f"{mailing_time}-{uuid4().hex[:8]}"
+            ledger.enqueue(rest, day, run_id)
+            queued = set(rest)
+            photos = None
+            if photo_pool.no_repeats and not cat_url:
+                photos = {chat_id: get_random_photo(chat_id) for chat_id in rest}
+            job = {'db': config.DB_NAME, 'token': config.BOT_TOKEN, 'api_url': telebot.apihelper.API_URL,
+                   'run_id': run_id, 'day': day, 'slot_time': slot_time, 'photo': random_photo, 'photos': photos,
+                   'cat': bool(cat_url), 'threads': broadcaster.workers, 'rate': mailing_rate / mailing_processes,
+                   'batch_size': broadcaster.workers * 5, 'lease_seconds': 300}
+            stats, cat_messages = run_shards(job, mailing_processes, ledger, stats)
+            for chat_id, message_id in cat_messages:
+                delete_message(chat_id, message_id, 86400)
+        else:
+            stats = broadcaster.run(rest, send_to_chat, stats, on_sent=after_send)
+        record_mailing(mailing_time, day, stats, time.perf_counter() - started)
+    except Exception as e:
+        registry.inc("mailing_errors")
+        logger.exception(f"Ошибка при отправке утренней рассылки: {e}")
+    finally:
+        # И после ошибки посреди рассылки: неотправленные чаты сразу достаются catch-up, а не ждут конца аренды.
+        # Отданные процессам рассылки чаты те помечают сами, здесь — только оставшиеся в очереди
+        try:
+            ledger.mark_unsent_failed([chat_id for chat_id in chat_ids
+                                       if chat_id not in delivered and chat_id not in queued], day)
+            ledger.mark_unsent_failed(queued, day, 'queued')
+        except Exception as e:
+            logger.exception(f"Не удалось вернуть неотправленные чаты рассылки {mailing_time} в журнал: {e}")
+        if profiler:
+            profiler.stop()
+            report = profiler.report()
+            logger.info(f"Профиль рассылки {mailing_time}:\n{report}")
             try:
-                with sql.connect(config.DB_NAME) as con:
-                    c = con.cursor()
-                    c.execute("SELECT name FROM birthdays WHERE substr(birthday_date, 1, 5) = ? AND chat_id = ?", (today, chat_id))
-                    birthdays = [row[0] for row in c.fetchall()]
-                
-                if birthdays:
-                    if len(birthdays) == 1:
-                        message = f"Сегодня {birthdays[0]} празднует день рождения! 😺🎉\nПоздравляем!"
-                    elif len(birthdays) == 2:
-                        message = f"Сегодня {birthdays[0]} и {birthdays[1]} празднуют день рождения! 😺🎉\nПоздравляем!🥳"
-                    else:
-                        message = "Сегодня дни рождения у:\n"
-                        for name in birthdays:
-                            message += f"🎂 {name}\n"
-                        message += "Поздравляем всех именинников!😺🎉"
-                else:
-                    message = "Доброе утро!😺"
-                
-                if random_photo:
-                    if isinstance(random_photo, str) and random_photo.startswith('http'):
-                        msg = bot.send_photo(chat_id, random_photo, caption=message)
-                        delete_message(chat_id, msg.message_id, 86400)
-                    else:
-                        bot.send_photo(chat_id, random_photo, caption=message)
-                else:
-                    bot.send_message(chat_id, message)
+                bot.send_message(report_to, report[:4000])
             except Exception as e:
-                print(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
-    except Exception as e:
-        print(f"Ошибка при отправке утренней рассылки: {e}")
+                logger.warning(f"Не удалось отправить профиль рассылки: {e}")
 
 def run_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(morning_mailing, 'cron', minute='*')
+    load_mailing_schedule()
     scheduler.start()
+    sync_mailing_jobs()
+    scheduler.add_job(catch_up_mailings, 'interval', minutes=5, id="catch_up_mailings", replace_existing=True,
+                      next_run_time=datetime.now())
     
     try:
         while True:
@@ -144,10 +340,6 @@ def run_scheduler():
     except (KeyboardInterrupt, SystemExit):
         scheduler.shutdown()
 
-scheduler_thread = Thread(target=run_scheduler)
-scheduler_thread.daemon = True
-scheduler_thread.start()
-
 def get_photo(message):
     request = message.text
     user_id = message.from_user.id
@@ -157,56 +349,77 @@ def get_photo(message):
         return
     
     try:
-        with sql.connect(config.DB_NAME) as con:
-            c = con.cursor()
-            c.execute("SELECT file_id FROM photo WHERE caption = ?", (request,))
-            result = c.fetchone()
-            if result:
-                file_id = result[0]
-                bot.send_photo(message.chat.id, file_id, caption="Вот ваше фото!")
-                if user_id in user_states:
-                    del user_states[user_id]
-            else:
-                bot.send_message(message.chat.id, "Фото по запросу не найдено. Попробуйте другую подпись или введите /cancel для отмены.")
+        file_id = caption_index.find(request)
+        if file_id:
+            bot.send_photo(message.chat.id, file_id, caption="Вот ваше фото!")
+            user_states.pop(user_id)
+            return
+        suggestions = caption_index.suggest(request)
+        if suggestions:
+            markup = types.InlineKeyboardMarkup()
+            for photo_id, caption in suggestions:
+                markup.add(types.InlineKeyboardButton(caption[:64], callback_data=f"photo:{photo_id}"))
+            bot.send_message(message.chat.id, "Точного совпадения нет. Возможно, вы имели в виду:", reply_markup=markup)
+        else:
+            bot.send_message(message.chat.id, "Фото по запросу не найдено. Попробуйте другую подпись или введите /cancel для отмены.")
     except Exception as e:
         bot.send_message(message.chat.id, f"Ошибка при получении фото: {str(e)}")
+
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith("photo:"))
+@registry.timed("handler_seconds")
+def send_suggested_photo(call):
+    try:
+        file_id = caption_index.get_file_id(int(call.data.split(":", 1)[1]))
+        if file_id:
+            bot.send_photo(call.message.chat.id, file_id, caption="Вот ваше фото!")
+            user_states.pop(call.from_user.id)
+        else:
+            bot.send_message(call.message.chat.id, "Фото больше нет в базе.")
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        bot.answer_callback_query(call.id, f"Ошибка при получении фото: {str(e)}")
         
 @bot.message_handler(commands=["start"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def main(message):
      msg = bot.send_message(message.chat.id, f"Привет, {message.from_user.first_name}!")
      delete_message(message.chat.id, msg.message_id, 10)
      delete_message(message.chat.id, message.message_id, 10)
     
 @bot.message_handler(commands=["add_photo"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def add_photo_command(message):
     if message.from_user.id in admin_ids:
-        user_states[message.from_user.id] = "waiting_photo"
+        user_states.set(message.from_user.id, "waiting_photo")
         msg = bot.send_message(message.chat.id, "Загрузите фото и добавьте к нему подпись (необязательно)")
     else:
         bot.send_message(message.chat.id, f"{message.from_user.first_name}, у вас нет прав для загрузки изображений")
        
 @bot.message_handler(commands=["get_photo"], chat_types=["private"])
+@registry.timed("handler_seconds")
 def request_photo(message):
     user_id = message.from_user.id
-    user_states[user_id] = "waiting_get_photo"
+    user_states.set(user_id, "waiting_get_photo")
     bot.send_message(message.chat.id, "Напишите подпись фото для того, чтобы я вам его вывел")
             
 @bot.message_handler(content_types=['photo'], chat_types=['private'])
+@registry.timed("handler_seconds")
 def handle_photo(message):
     user_id = message.from_user.id
-    if user_id in user_states and user_states[user_id] == "waiting_photo":
+    if user_states.get(user_id) == "waiting_photo":
         try:
             file_id = message.photo[-1].file_id
             caption = message.caption or "Нет подписи"
-            with sql.connect(config.DB_NAME) as con:
+            with db.connection("add_photo") as con:
                 c = con.cursor()
-                c.execute("INSERT INTO photo (file_id, caption) VALUES (?, ?)", (file_id, caption))
+                c.execute("INSERT INTO photo (file_id, caption, caption_folded) VALUES (?, ?, ?)",
+                          (file_id, caption, fold_caption(caption)))
+                photo_pool.add(c.lastrowid)
             bot.reply_to(message, "Фото успешно сохранено!")
-            del user_states[user_id]
+            user_states.pop(user_id)
         except Exception as e:
             bot.reply_to(message, f"Ошибка при сохранении: {str(e)}")
-            if user_id in user_states:
-                del user_states[user_id]
+            user_states.pop(user_id)
     else:
         if message.from_user.id in admin_ids:
             bot.reply_to(message, "Чтобы сохранить фото, используйте команду /add_photo")
@@ -214,26 +427,27 @@ def handle_photo(message):
             bot.send_message(message.chat.id, "Ошибка!")
 
 @bot.message_handler(commands=["cancel"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def cancel(message):
     user_id = message.from_user.id
-    if user_id in user_states:
-        del user_states[user_id]
+    if user_states.pop(user_id) is not None:
         msg = bot.send_message(message.chat.id, "Текущее действия отменено.")
         delete_message(message.chat.id, msg.message_id, 10)
         delete_message(message.chat.id, message.message_id, 10)
     else:
-        bot.send_message(message.chat.id, "Нет активных действий для отмены.")
+        msg = bot.send_message(message.chat.id, "Нет активных действий для отмены.")
         delete_message(message.chat.id, msg.message_id, 10)
         delete_message(message.chat.id, message.message_id, 10)
 
 @bot.message_handler(commands=["add_chat"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def add_chat_command(message):
     if message.from_user.id in admin_ids:
         try:
             if len(message.text.split()) > 1:
                 chat_id = int(message.text.split()[1])
                 try:
-                    chat_info = bot.get_chat(chat_id)
+                    chat_info = chat_info_cache.get_chat(chat_id)
                     title = chat_info.title
                     add_chat(chat_id, title)
                     bot.reply_to(message, f"Чат '{title}' (ID: {chat_id}) добавлен для утренней рассылки!")
@@ -243,6 +457,7 @@ def add_chat_command(message):
                 chat_id = message.chat.id
                 title = message.chat.title
                 add_chat(chat_id, title)
+                chat_info_cache.remember(message.chat)
                 bot.reply_to(message, f"Текущий чат: {title}, имеющий ID: {chat_id}, успешно добавлен для утренней рассылки")
         except ValueError:
             bot.reply_to(message, "Неверный формат ID чата.")
@@ -252,6 +467,7 @@ def add_chat_command(message):
         bot.reply_to(message, "Недостаточно прав")
 
 @bot.message_handler(commands=["set_mailing_time"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def set_mailing_time(message):
     if message.from_user.id in admin_ids:
         try:
@@ -275,6 +491,7 @@ def set_mailing_time(message):
         bot.reply_to(message, "Недостаточно прав")
 
 @bot.message_handler(commands=["get_chat_id"])
+@registry.timed("handler_seconds")
 def get_chat_id(message):
     chat_id = message.chat.id
     title = message.chat.title
@@ -283,9 +500,12 @@ def get_chat_id(message):
     delete_message(message.chat.id, message.message_id, 60)
 
 @bot.message_handler(content_types=['new_chat_members'], chat_types=['group', 'supergroup'])
+@registry.timed("handler_seconds")
 def handle_new_members(message):
+    chat_info_cache.remember(message.chat)
+    bot_id = chat_info_cache.get_me().id
     for new_member in message.new_chat_members:
-        if new_member.id == bot.get_me().id:
+        if new_member.id == bot_id:
             welcome_text = (
                 "Привет! Я бот для утренних рассылок и поздравлений с днем рождения.\n\n"
                 "Администраторы бота могут настроить время рассылки с помощью /set_mailing_time"
@@ -293,6 +513,7 @@ def handle_new_members(message):
             bot.send_message(message.chat.id, welcome_text)
 
 @bot.message_handler(commands=["add_birthday"], chat_types=['group', 'supergroup', 'private'])
+@registry.timed("handler_seconds")
 def add_birthday_command(message):
     if message.from_user.id not in admin_ids:
         bot.reply_to(message, "Недостаточно прав")
@@ -327,24 +548,26 @@ def add_birthday_command(message):
             bot.reply_to(message, f"Неверный формат даты. Используйте: {config.DATE_FORMAT.replace('%', '')}")
             return
             
-        with sql.connect(config.DB_NAME) as con:
+        with db.connection("add_birthday") as con:
             c = con.cursor()
             c.execute("SELECT 1 FROM chats WHERE chat_id = ?", (chat_id,))
             if not c.fetchone():
                 bot.reply_to(message, f"Чат с ID {chat_id} не найден в базе. Сначала добавьте чат с помощью /add_chat")
                 return
-            
-        with sql.connect(config.DB_NAME) as con:
-            c = con.cursor()
-            c.execute("INSERT INTO birthdays (name, birthday_date, chat_id) VALUES (?, ?, ?)",
-                     (name, formatted_date, chat_id))
+            c.execute("INSERT OR IGNORE INTO birthdays (name, birthday_date, birthday_md, chat_id) VALUES (?, ?, ?, ?)",
+                     (name, formatted_date, birth_date.strftime("%m-%d"), chat_id))
+            inserted = c.rowcount > 0
                      
-        bot.reply_to(message, f"День рождения для {name} установлен на {formatted_date} в чате {chat_id}")
+        if inserted:
+            bot.reply_to(message, f"День рождения для {name} установлен на {formatted_date} в чате {chat_id}")
+        else:
+            bot.reply_to(message, f"День рождения для {name} на {formatted_date} в чате {chat_id} уже есть")
             
     except Exception as e:
         bot.reply_to(message, f"Произошла ошибка: {str(e)}")
 
 @bot.message_handler(commands=["remove_birthday"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def remove_birthday_command(message):
     if message.from_user.id not in admin_ids:
         bot.reply_to(message, "Недостаточно прав")
@@ -361,19 +584,18 @@ def remove_birthday_command(message):
             return
         name = parts[2]
         
-        with sql.connect(config.DB_NAME) as con:
-            c = con.cursor()
-            c.execute("DELETE FROM birthdays WHERE name = ? AND chat_id = ?", (name, chat_id))
+        deleted = db.execute("DELETE FROM birthdays WHERE name = ? AND chat_id = ?", (name, chat_id))
             
-            if c.rowcount > 0:
-                bot.reply_to(message, f"День рождения для {name} в чате {chat_id} удален")
-            else:
-                bot.reply_to(message, f"День рождения для {name} в чате {chat_id} не найден")
+        if deleted > 0:
+            bot.reply_to(message, f"День рождения для {name} в чате {chat_id} удален")
+        else:
+            bot.reply_to(message, f"День рождения для {name} в чате {chat_id} не найден")
             
     except Exception as e:
         bot.reply_to(message, f"Произошла ошибка: {str(e)}")
 
 @bot.message_handler(commands=["list_birthdays"], chat_types=['private'])
+@registry.timed("handler_seconds")
 def list_birthdays_command(message):
     if message.from_user.id not in admin_ids:
         bot.reply_to(message, "Недостаточно прав")
@@ -390,31 +612,131 @@ def list_birthdays_command(message):
             bot.reply_to(message, "Неверный формат chat_id. Используйте целое число.")
             return
         
-        with sql.connect(config.DB_NAME) as con:
-            c = con.cursor()
-            c.execute("SELECT name, birthday_date FROM birthdays WHERE chat_id = ? ORDER BY birthday_date", (chat_id,))
-            birthdays = c.fetchall()
-            
-            if not birthdays:
-                bot.reply_to(message, f"В чате {chat_id} нет дней рождения")
-                return
-                
-            message_text = f"Список дней рождения в чате {chat_id}:\n\n"
-            for name, date in birthdays:
-                message_text += f"{name} - {date}\n"
-                
-            bot.reply_to(message, message_text)
+        page = render_birthdays_page(chat_id, datetime.now().strftime("%m-%d"))
+        if not page:
+            bot.reply_to(message, f"В чате {chat_id} нет дней рождения")
+            return
+        text, markup = page
+        bot.reply_to(message, text, reply_markup=markup)
             
     except Exception as e:
         bot.reply_to(message, f"Произошла ошибка: {str(e)}")
 
+def render_birthdays_page(chat_id, today, cursor=None, backwards=False):
+    rows, has_prev, has_next = birthdays_page(db, chat_id, today, cursor, backwards)
+    if not rows:
+        return None
+    message_text = f"Список дней рождения в чате {chat_id} (ближайшие сначала):\n\n"
+    for row in rows:
+        message_text += f"{row[3][:100]} - {row[4]}\n"
+    markup = types.InlineKeyboardMarkup()
+    buttons = []
+    if has_prev:
+        buttons.append(types.InlineKeyboardButton("⬅️ Назад", callback_data=encode_cursor(chat_id, today, "p", rows[0])))
+    if has_next:
+        buttons.append(types.InlineKeyboardButton("Дальше ➡️", callback_data=encode_cursor(chat_id, today, "n", rows[-1])))
+    if buttons:
+        markup.row(*buttons)
+    return message_text, markup
+
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith("bd:"))
+@registry.timed("handler_seconds")
+def birthdays_page_callback(call):
+    if call.from_user.id not in admin_ids:
+        bot.answer_callback_query(call.id, "Недостаточно прав")
+        return
+    try:
+        chat_id, today, backwards, cursor = decode_cursor(call.data)
+        page = render_birthdays_page(chat_id, today, cursor, backwards)
+        if page:
+            text, markup = page
+            bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        bot.answer_callback_query(call.id, f"Произошла ошибка: {str(e)}")
+
+@bot.message_handler(commands=["import_birthdays"], chat_types=['private'])
+@registry.timed("handler_seconds")
+def import_birthdays_command(message):
+    if message.from_user.id not in admin_ids:
+        bot.reply_to(message, "Недостаточно прав")
+        return
+    user_states.set(message.from_user.id, "waiting_import")
+    bot.reply_to(message, "Пришлите файл .csv или .jsonl с полями chat_id, name, birthday_date "
+                          f"(дата в формате {config.DATE_FORMAT.replace('%', '')})")
+
+@bot.message_handler(content_types=['document'], chat_types=['private'])
+@registry.timed("handler_seconds")
+def handle_document(message):
+    user_id = message.from_user.id
+    if user_states.get(user_id) != "waiting_import":
+        bot.reply_to(message, "Чтобы загрузить дни рождения из файла, используйте команду /import_birthdays")
+        return
+    user_states.pop(user_id)
+    try:
+        filename = message.document.file_name or ""
+        data = bot.download_file(bot.get_file(message.document.file_id).file_path)
+        stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+        report = import_birthdays(db, stream, file_format(filename), config.DATE_FORMAT)
+        bot.reply_to(message, str(report)[:4000])
+    except Exception as e:
+        bot.reply_to(message, f"Ошибка при загрузке файла: {str(e)}")
+
+@bot.message_handler(commands=["export"], chat_types=['private'])
+@registry.timed("handler_seconds")
+def export_command(message):
+    if message.from_user.id not in admin_ids:
+        bot.reply_to(message, "Недостаточно прав")
+        return
+    parts = message.text.split()
+    tables = [parts[1]] if len(parts) > 1 else ["birthdays", "chats"]
+    fmt = parts[2] if len(parts) > 2 else "csv"
+    if any(table not in ("birthdays", "chats") for table in tables) or fmt not in ("csv", "jsonl"):
+        bot.reply_to(message, "Используйте: /export [birthdays|chats] [csv|jsonl]")
+        return
+    for table in tables:
+        try:
+            # Строки пишем во временный файл пачками, всю таблицу в память не загружаем
+            with tempfile.TemporaryFile("w+b") as f:
+                stream = io.TextIOWrapper(f, encoding="utf-8", newline="")
+                count = export_table(db, table, stream, fmt)
+                stream.flush()
+                f.seek(0)
+                bot.send_document(message.chat.id, f, visible_file_name=f"{table}.{fmt}", caption=f"{table}: {count}")
+                stream.detach()
+        except Exception as e:
+            bot.reply_to(message, f"Ошибка при выгрузке {table}: {str(e)}")
+
+@bot.message_handler(commands=["stats"], chat_types=['private'])
+@registry.timed("handler_seconds")
+def stats_command(message):
+    if message.from_user.id not in admin_ids:
+        bot.reply_to(message, "Недостаточно прав")
+        return
+    text = (f"Последняя рассылка: {last_mailing or 'ещё не было'}\n"
+            f"Данные чатов: {chat_info_cache}\n\n{registry.summary()}")
+    for i in range(0, len(text), 4000):
+        bot.send_message(message.chat.id, text[i:i + 4000])
+
+@bot.message_handler(commands=["profile_mailing"], chat_types=['private'])
+@registry.timed("handler_seconds")
+def profile_mailing_command(message):
+    global profile_chat
+    if message.from_user.id not in admin_ids:
+        bot.reply_to(message, "Недостаточно прав")
+        return
+    with profile_lock:
+        profile_chat = message.chat.id
+    bot.reply_to(message, "Следующая рассылка пройдёт под профилировщиком, отчёт пришлю сюда")
+
 @bot.message_handler(func=lambda message: True)
+@registry.timed("handler_seconds")
 def handle_all_messages(message):
     user_id = message.from_user.id
-    if message.chat.type != 'private' and user_id not in user_states:
+    state = user_states.get(user_id)
+    if message.chat.type != 'private' and state is None:
         return
-    if user_id in user_states:
-        state = user_states[user_id]
+    if state is not None:
         if state == "waiting_photo":
             bot.send_message(message.chat.id, "Пожалуйста, загрузите изображение, а не текст")
         elif state == "waiting_get_photo":
@@ -422,4 +744,32 @@ def handle_all_messages(message):
         else:
             bot.send_message(message.chat.id, "Ваше сообщение не обработано, воспользуйтесь меню команд")
 
-bot.infinity_polling()
\ No newline at end of file
+def run_bot():
+    setup_logging(getattr(config, 'LOG_LEVEL', 'INFO'), json_format=getattr(config, 'LOG_JSON', False))
+    init_db()
+    if getattr(config, 'METRICS_PORT', None):
+        MetricsServer(registry, host=getattr(config, 'METRICS_HOST', '127.0.0.1'), port=config.METRICS_PORT).start()
+    scheduler_thread = Thread(target=run_scheduler)
+    scheduler_thread.daemon = True
+    scheduler_thread.start()
+    deletion_scheduler.start()
+    cat_pool.start()
+    try:
+        chat_info_cache.get_me()
+    except Exception as e:
+        logger.warning(f"Не удалось получить данные бота: {e}")
+
+    if webhook_url:
+        run_webhook(bot, webhook_url, host=getattr(config, 'WEBHOOK_HOST', '0.0.0.0'), port=getattr(config, 'WEBHOOK_PORT', 8443),
+                    secret_token=getattr(config, 'WEBHOOK_SECRET', None), workers=getattr(config, 'WEBHOOK_WORKERS', 4),
+                    queue_size=getattr(config, 'WEBHOOK_QUEUE_SIZE', 1000), certfile=getattr(config, 'WEBHOOK_CERT', None),
+                    keyfile=getattr(config, 'WEBHOOK_KEY', None))
+    else:
+        # Вебхук, оставшийся с прошлого запуска, Telegram не снимает сам: getUpdates при нём отвечает 409
+        bot.remove_webhook()
+        bot.infinity_polling()
+
+# Импорт модуля ничего не запускает: так его подгружают процессы рассылки (spawn) и бенчмарки
+if __name__ == "__main__":
+    freeze_support()
+    run_bot()
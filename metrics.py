@@ -0,0 +1,288 @@
+import json
+import logging
+import sys
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread, get_ident
+
+# Границы корзин гистограмм в секундах: от запроса к SQLite до целой рассылки
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Верхняя граница корзины, в которую попал q-й квантиль: точнее без хранения всех значений не получится
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            if total >= rank and count:
+                return bound
+        return 0.0
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    labels = labels + extra
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    # Счётчики, гистограммы и снимаемые при чтении показатели (размеры очередей и кэшей)
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, read, **labels):
+        with self.lock:
+            self.gauges[(name, _labels(labels))] = read
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        # Декоратор: время каждого вызова в гистограмму name, необработанные исключения — в name_errors.
+        # Без явных меток вызовы различаются по имени функции
+        def decorator(func):
+            func_labels = labels or {'function': func.__name__}
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    self.inc(f"{name}_errors", **func_labels)
+                    raise
+                finally:
+                    self.observe(name, time.perf_counter() - started, **func_labels)
+            return wrapper
+        return decorator
+
+    def _read_gauges(self):
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = []
+        for key, read in gauges:
+            try:
+                values.append((key, read()))
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Не удалось снять показатель {key[0]}: {e}")
+        return values
+
+    def render(self):
+        # Текстовый формат Prometheus
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count))
+                                for key, h in self.histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name}_total counter")
+            lines.append(f"{name}_total{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in sorted(self._read_gauges()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, top=15):
+        # Короткая сводка для /stats: самые частые вызовы с p50/p99 и все счётчики
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(((key, h.count, h.sum / h.count if h.count else 0.0, h.quantile(0.5), h.quantile(0.99))
+                                 for key, h in self.histograms.items()), key=lambda item: -item[1])
+        lines = ["Задержки (вызовов, среднее, p50, p99):"]
+        for (name, labels), count, mean, p50, p99 in histograms[:top]:
+            lines.append(f"{name}{_format_labels(labels)}: {count}, {mean * 1000:.1f} мс, "
+                         f"≤{p50 * 1000:g} мс, ≤{p99 * 1000:g} мс")
+        lines.append("Счётчики:")
+        lines += [f"{name}{_format_labels(labels)}: {value}" for (name, labels), value in counters]
+        lines.append("Показатели:")
+        lines += [f"{name}{_format_labels(labels)}: {value}" for (name, labels), value in sorted(self._read_gauges())]
+        return "\n".join(lines)
+
+
+registry = Metrics()
+
+
+class MetricsServer:
+    # GET /metrics для Prometheus, отдельно от вебхука, чтобы не открывать его наружу
+    def __init__(self, metrics, host="127.0.0.1", port=9100, path="/metrics"):
+        self.metrics = metrics
+        self.path = path
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.partition("?")[0] != server.path:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                data = server.metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись — одна JSON-строка; поля из extra={'fields': {...}} попадают в неё как есть
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+def setup_logging(level="INFO", json_format=False):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if json_format else TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+
+class SamplingProfiler:
+    # Раз в interval секунд снимает стеки потока, который его запустил, и всех потоков, созданных после запуска:
+    # рассылка идёт в пуле потоков, а cProfile видит только поток, в котором его включили
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.own = Counter()
+        self.total = Counter()
+        self.samples = 0
+        self.ignored = set()
+        self.stopped = Event()
+        self.thread = None
+
+    def _sample(self):
+        self.ignored.add(get_ident())
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in self.ignored:
+                    continue
+                seen = set()
+                leaf = True
+                while frame is not None:
+                    code = frame.f_code
+                    where = f"{code.co_filename}:{code.co_firstlineno} {code.co_name}"
+                    if leaf:
+                        self.own[where] += 1
+                        leaf = False
+                    if where not in seen:
+                        seen.add(where)
+                        self.total[where] += 1
+                    frame = frame.f_back
+            self.samples += 1
+
+    def start(self):
+        # Опрос Telegram, планировщик и прочие уже работающие потоки в отчёт не попадают
+        self.ignored = set(sys._current_frames()) - {get_ident()}
+        self.thread = Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self, top=20):
+        lines = [f"Снимков: {self.samples} (каждые {self.interval * 1000:g} мс, по всем потокам)", "Собственное время:"]
+        lines += [f"{count:>6} {where}" for where, count in self.own.most_common(top)]
+        lines.append("Вместе с вызванными:")
+        lines += [f"{count:>6} {where}" for where, count in self.total.most_common(top)]
+        return "\n".join(lines)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,188 @@
+import random
+import time
+from array import array
+from difflib import SequenceMatcher
+from threading import Lock
+
+from cache import LRUCache
+
+
+class PhotoPool:
+    # id всех фото держим в памяти: случайный выбор не зависит от размера таблицы, в отличие от ORDER BY RANDOM()
+    def __init__(self, db, no_repeats=False):
+        self.db = db
+        self.no_repeats = no_repeats
+        self.ids = None
+        self.seen = {}
+        self.lock = Lock()
+
+    def _load(self):
+        if self.ids is None:
+            self.ids = array('q', (row[0] for row in self.db.fetchall("SELECT id FROM photo")))
+
+    def add(self, photo_id):
+        with self.lock:
+            if self.ids is not None:
+                self.ids.append(photo_id)
+
+    def _pick_id(self, chat_id):
+        with self.lock:
+            self._load()
+            if not self.ids:
+                return None
+            if not self.no_repeats or chat_id is None:
+                return random.choice(self.ids)
+            # Без повторов: чат видит каждое фото по разу, пока пул не закончится
+            seen = self.seen.setdefault(chat_id, set())
+            if len(seen) >= len(self.ids):
+                seen.clear()
+            if len(seen) * 4 < len(self.ids) * 3:
+                photo_id = random.choice(self.ids)
+                while photo_id in seen:
+                    photo_id = random.choice(self.ids)
+            else:
+                photo_id = random.choice([i for i in self.ids if i not in seen])
+            seen.add(photo_id)
+            return photo_id
+
+    def pick(self, chat_id=None):
+        photo_id = self._pick_id(chat_id)
+        if photo_id is None:
+            return None
+        row = self.db.fetchone("SELECT file_id FROM photo WHERE id = ?", (photo_id,))
+        return row[0] if row else None
+
+
+def create_photo_fts(c):
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'photo_fts'")
+    if c.fetchone():
+        return
+    c.execute("""CREATE VIRTUAL TABLE photo_fts USING fts5(
+        caption, content='photo', content_rowid='id', tokenize='trigram'
+    )""")
+    c.execute("""CREATE TRIGGER photo_fts_insert AFTER INSERT ON photo BEGIN
+        INSERT INTO photo_fts (rowid, caption) VALUES (new.id, new.caption);
+    END""")
+    c.execute("""CREATE TRIGGER photo_fts_delete AFTER DELETE ON photo BEGIN
+        INSERT INTO photo_fts (photo_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+    END""")
+    c.execute("""CREATE TRIGGER photo_fts_update AFTER UPDATE OF caption ON photo BEGIN
+        INSERT INTO photo_fts (photo_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+        INSERT INTO photo_fts (rowid, caption) VALUES (new.id, new.caption);
+    END""")
+    c.execute("INSERT INTO photo_fts (photo_fts) VALUES ('rebuild')")
+
+
+def fold_caption(caption):
+    # casefold, а не NOCASE: SQLite сам приводит к одному регистру только латиницу
+    return caption.strip().casefold()
+
+
+def create_caption_folded(c):
+    c.execute("PRAGMA table_info(photo)")
+    if "caption_folded" not in [row[1] for row in c.fetchall()]:
+        c.execute("ALTER TABLE photo ADD COLUMN caption_folded TEXT")
+    # Заполняем и строки, добавленные в обход бота
+    c.execute("SELECT id, caption FROM photo WHERE caption_folded IS NULL")
+    c.executemany("UPDATE photo SET caption_folded = ? WHERE id = ?",
+                  [(fold_caption(caption or ""), row_id) for row_id, caption in c.fetchall()])
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photo_caption_folded ON photo (caption_folded)")
+
+
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+class CaptionIndex:
+    # Точное совпадение без учёта регистра ищем по индексу caption_folded, похожие подписи — через FTS5 с триграммами
+    def __init__(self, db, cache_size=256, candidates=50):
+        self.db = db
+        self.cache = LRUCache(cache_size)
+        self.candidates = candidates
+
+    def find(self, caption):
+        key = fold_caption(caption)
+        file_id = self.cache.get(key)
+        if file_id:
+            return file_id
+        # Из нескольких подходящих подписей предпочитаем совпавшую вместе с регистром
+        row = self.db.fetchone("SELECT file_id FROM photo WHERE caption_folded = ? ORDER BY caption != ?, id LIMIT 1",
+                               (key, caption.strip()))
+        if not row:
+            return None
+        self.cache.set(key, row[0])
+        return row[0]
+
+    def suggest(self, query, limit=5, cutoff=0.4):
+        key = fold_caption(query)
+        if not key:
+            return []
+        # Подписи, начинающиеся с запроса, берём по индексу: среди совпадений FTS их может не оказаться, если запрос —
+        # частое слово, а короче трёх символов FTS с триграммами не ищет вовсе
+        rows = self.db.fetchall("SELECT id, caption FROM photo WHERE caption_folded >= ? AND caption_folded < ? "
+                                "ORDER BY caption_folded LIMIT ?", (key, key + "\U0010ffff", self.candidates))
+        trigrams = {key[i:i + 3] for i in range(len(key) - 2)}
+        if not trigrams:
+            return self._rank(key, rows, limit, cutoff)
+        # ORDER BY rank пришлось бы считать по всем совпадениям, а частые триграммы («кот») есть почти в каждой
+        # подписи. Без сортировки FTS5 отдаёт строки потоком, так что LIMIT ограничивает работу сверху
+        rows += self.db.fetchall("SELECT rowid, caption FROM photo_fts WHERE photo_fts MATCH ? LIMIT ?",
+                                 (fts_phrase(key), self.candidates))
+        if len(rows) < limit:
+            rows += self.db.fetchall("SELECT rowid, caption FROM photo_fts WHERE photo_fts MATCH ? LIMIT ?",
+                                     (" OR ".join(fts_phrase(t) for t in trigrams), self.candidates * 4))
+        return self._rank(key, rows, limit, cutoff)
+
+    def _rank(self, key, rows, limit, cutoff):
+        scored = []
+        for photo_id, caption in dict(rows).items():
+            folded = fold_caption(caption)
+            score = SequenceMatcher(None, key, folded).ratio()
+            if folded.startswith(key):
+                score += 1
+            if score >= cutoff:
+                scored.append((score, photo_id, caption))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(photo_id, caption) for _, photo_id, caption in scored[:limit]]
+
+    def get_file_id(self, photo_id):
+        row = self.db.fetchone("SELECT file_id FROM photo WHERE id = ?", (photo_id,))
+        return row[0] if row else None
+
+
+def create_media_cache_table(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS media_cache (
+        source_url TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        last_used REAL NOT NULL
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_media_cache_last_used ON media_cache (last_used)")
+
+
+class MediaCache:
+    # Картинку по ссылке Telegram скачивает один раз, дальше шлём её file_id; старые записи вытесняются по LRU
+    def __init__(self, db, maxsize=1000):
+        self.db = db
+        self.maxsize = maxsize
+
+    def get(self, source_url):
+        row = self.db.fetchone("SELECT file_id FROM media_cache WHERE source_url = ?", (source_url,))
+        if row:
+            self.db.execute("UPDATE media_cache SET last_used = ? WHERE source_url = ?", (time.time(), source_url))
+        return row[0] if row else None
+
+    def remember(self, source_url, message):
+        file_id = message.photo[-1].file_id
+        with self.db.connection("media_cache_remember") as con:
+            c = con.cursor()
+            c.execute("INSERT OR REPLACE INTO media_cache (source_url, file_id, last_used) VALUES (?, ?, ?)",
+                      (source_url, file_id, time.time()))
+            c.execute("""DELETE FROM media_cache WHERE source_url IN (
+                SELECT source_url FROM media_cache ORDER BY last_used
+                LIMIT max(0, (SELECT COUNT(*) FROM media_cache) - ?)
+            )""", (self.maxsize,))
+        return file_id
+
+    def random_source(self):
+        row = self.db.fetchone("SELECT source_url FROM media_cache ORDER BY RANDOM() LIMIT 1")
+        return row[0] if row else None
@@ -0,0 +1,85 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import telebot
+
+from birthdays import birthday_message, get_birthdays
+from broadcast import Broadcaster, BroadcastStats
+from db import ConnectionPool
+from deliveries import DeliveryLedger
+
+logger = logging.getLogger(__name__)
+
+
+def run_shard(job, owner):
+    # Выполняется в отдельном процессе: свои бот, соединения с базой и потоки отправки, общий только журнал рассылок
+    telebot.apihelper.API_URL = job['api_url']
+    bot = telebot.TeleBot(job['token'], threaded=False)
+    db = ConnectionPool(job['db'], size=2)
+    ledger = DeliveryLedger(db)
+    broadcaster = Broadcaster(workers=job['threads'], rate=job['rate'])
+    stats = BroadcastStats()
+    day = job['day']
+    photos = job['photos'] or {}
+    cat_messages = []
+    delivered = set()
+
+    try:
+        while True:
+            chat_ids = ledger.lease(job['run_id'], owner, day, job['batch_size'], job['lease_seconds'])
+            if not chat_ids:
+                break
+            birthdays_by_chat = get_birthdays(db, chat_ids, job['slot_time'])
+
+            def deliver(chat_id):
+                photo = photos.get(chat_id) or job['photo']
+                message = birthday_message(birthdays_by_chat.get(chat_id))
+                if photo:
+                    return bot.send_photo(chat_id, photo, caption=message)
+                return bot.send_message(chat_id, message)
+
+            def after_send(chat_id, msg):
+                # Как в main.morning_mailing: ошибка учёта не возвращает доставленный чат в очередь на повтор
+                delivered.add(chat_id)
+                if job['cat'] and not photos.get(chat_id):
+                    cat_messages.append((chat_id, msg.message_id))
+                ledger.mark_sent(chat_id, day)
+
+            broadcaster.run(chat_ids, deliver, stats, on_sent=after_send)
+            ledger.mark_unsent_failed([chat_id for chat_id in chat_ids if chat_id not in delivered], day)
+    finally:
+        db.close()
+    return stats.sent, stats.failed, stats.retries, stats.throttled, stats.errors, stats.latencies, cat_messages
+
+
+def run_shards(job, processes, ledger, stats=None):
+    # Координатор: чаты уже стоят в журнале в статусе queued с lease_owner = run_id, процессы разбирают их пачками.
+    # Процессы запускаются через spawn: fork из процесса с потоками планировщика и опроса может зависнуть на чужих
+    # блокировках
+    stats = stats or BroadcastStats()
+    cat_messages = []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn")) as executor:
+        futures = [executor.submit(run_shard, job, f"{job['run_id']}/{i}") for i in range(processes)]
+        for future in futures:
+            try:
+                sent, failed, retries, throttled, errors, latencies, messages = future.result()
+            except Exception as e:
+                logger.error(f"Процесс рассылки завершился с ошибкой: {e}")
+                continue
+            stats.sent += sent
+            stats.failed += failed
+            stats.retries += retries
+            stats.throttled += throttled
+            for code, count in errors.items():
+                stats.errors[code] = stats.errors.get(code, 0) + count
+            stats.latencies.extend(latencies)
+            cat_messages.extend(messages)
+    # Все процессы завершились, так что sending под run_id остался только за упавшими. Чаты с истёкшей арендой
+    # отдаём catch-up сразу, остальные claim заберёт, когда истечёт и их аренда
+    abandoned = ledger.release_expired(job['run_id'], job['day'])
+    if abandoned:
+        logger.warning(f"Процессы рассылки бросили чатов: {abandoned}, их повторит catch-up")
+    stats.finished = time.monotonic()
+    return stats, cat_messages
@@ -0,0 +1,100 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+
+
+class StateStore(ABC):
+    # Состояния диалогов пользователей. Для нескольких процессов достаточно реализовать get/set/pop
+    # поверх общего хранилища
+    @abstractmethod
+    def get(self, user_id, default=None):
+        pass
+
+    @abstractmethod
+    def set(self, user_id, state):
+        pass
+
+    @abstractmethod
+    def pop(self, user_id, default=None):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self, ttl=3600, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, user_id, default=None):
+        with self.lock:
+            item = self.data.get(user_id)
+            if item is None:
+                return default
+            state, expires_at = item
+            if expires_at <= time.monotonic():
+                del self.data[user_id]
+                return default
+            return state
+
+    def set(self, user_id, state):
+        with self.lock:
+            self.data[user_id] = (state, time.monotonic() + self.ttl)
+            self.data.move_to_end(user_id)
+            # Порядок вставки совпадает с порядком истечения, поэтому и просроченные, и лишние лежат в начале
+            now = time.monotonic()
+            while self.data and (len(self.data) > self.maxsize or next(iter(self.data.values()))[1] <= now):
+                self.data.popitem(last=False)
+
+    def pop(self, user_id, default=None):
+        with self.lock:
+            item = self.data.pop(user_id, None)
+        if item is None or item[1] <= time.monotonic():
+            return default
+        return item[0]
+
+    def __len__(self):
+        return len(self.data)
+
+
+def create_states_table(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS user_states (
+        user_id INTEGER PRIMARY KEY,
+        state TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_states_expires ON user_states (expires_at)")
+
+
+class SQLiteStateStore(StateStore):
+    # Переживает перезапуск бота; годится и для нескольких процессов на одной базе
+    def __init__(self, db, ttl=3600, maxsize=10000):
+        self.db = db
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+    def get(self, user_id, default=None):
+        row = self.db.fetchone("SELECT state FROM user_states WHERE user_id = ? AND expires_at > ?", (user_id, time.time()))
+        return row[0] if row else default
+
+    def set(self, user_id, state):
+        with self.db.connection("state_set") as con:
+            c = con.cursor()
+            c.execute("INSERT OR REPLACE INTO user_states (user_id, state, expires_at) VALUES (?, ?, ?)",
+                      (user_id, state, time.time() + self.ttl))
+            c.execute("DELETE FROM user_states WHERE expires_at <= ?", (time.time(),))
+            c.execute("""DELETE FROM user_states WHERE user_id IN (
+                SELECT user_id FROM user_states ORDER BY expires_at
+                LIMIT max(0, (SELECT COUNT(*) FROM user_states) - ?)
+            )""", (self.maxsize,))
+
+    def pop(self, user_id, default=None):
+        with self.db.connection("state_pop") as con:
+            c = con.cursor()
+            c.execute("SELECT state, expires_at FROM user_states WHERE user_id = ?", (user_id,))
+            row = c.fetchone()
+            c.execute("DELETE FROM user_states WHERE user_id = ?", (user_id,))
+        if row is None or row[1] <= time.time():
+            return default
+        return row[0]
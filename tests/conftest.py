@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_api import FakeBotAPI  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    # main импортируется один раз на процесс, поэтому база и бот общие для всех тестов
+    from benchmarks.harness import load_main
+    return load_main(str(tmp_path_factory.mktemp("db") / "test.db"))
+
+
+@pytest.fixture
+def api():
+    with FakeBotAPI(retry_after=0) as api:
+        yield api
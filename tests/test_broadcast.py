@@ -0,0 +1,56 @@
+import time
+from threading import Thread
+
+import telebot
+
+from benchmarks.fake_api import FakeBotAPI
+from broadcast import Broadcaster, TokenBucket
+
+
+def test_slow_rate_bucket_does_not_spin():
+    bucket = TokenBucket(0.5)
+    thread = Thread(target=bucket.acquire, daemon=True)
+    thread.start()
+    thread.join(1)
+    assert not thread.is_alive()
+
+
+def test_pause_holds_every_acquire():
+    bucket = TokenBucket(1000)
+    bucket.pause(0.2)
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.2
+
+
+def test_broadcast_against_fake_api():
+    chat_ids = list(range(1, 31))
+    with FakeBotAPI(throttle_every=7, retry_after=1) as api:
+        bot = telebot.TeleBot("123:fake", threaded=False)
+        broadcaster = Broadcaster(workers=8, rate=1000, chat_interval=0)
+        stats = broadcaster.run(chat_ids, lambda chat_id: bot.send_message(chat_id, "Доброе утро"))
+    assert stats.sent == len(chat_ids)
+    assert stats.failed == 0
+    assert stats.throttled >= 1
+    assert stats.retries == stats.throttled
+    assert api.calls["sendMessage"] == len(chat_ids) + stats.throttled
+    assert all(api.sent[chat_id] == 1 for chat_id in chat_ids)
+    # После 429 ждёт retry_after весь бот, а не только чат, получивший отказ
+    assert stats.elapsed >= 1
+
+
+def test_throttled_broadcast_pauses_all_chats():
+    sent_at = []
+    with FakeBotAPI(throttle_every=1, retry_after=1) as api:
+        bot = telebot.TeleBot("123:fake", threaded=False)
+        broadcaster = Broadcaster(workers=4, rate=1000, chat_interval=0, max_retries=0)
+        started = time.monotonic()
+        broadcaster.run([1], lambda chat_id: bot.send_message(chat_id, "Доброе утро"))
+        api.throttle_every = 0
+
+        def send(chat_id):
+            sent_at.append(time.monotonic() - started)
+            return bot.send_message(chat_id, "Доброе утро")
+        broadcaster.run([2, 3], send)
+    assert api.sent[2] == api.sent[3] == 1
+    assert min(sent_at) >= 1
@@ -0,0 +1,42 @@
+import time
+
+from benchmarks.fake_api import FakeCatAPI
+from cats import CatPool
+
+
+def test_fill_from_api():
+    with FakeCatAPI() as api:
+        pool = CatPool(api.url, size=5)
+        pool.fill()
+        assert len(pool.urls) == 5
+        assert pool.get().startswith("https://cdn.example/cat")
+        assert api.requests == 1
+
+
+def test_failing_api_opens_breaker():
+    with FakeCatAPI(fail=True) as api:
+        pool = CatPool(api.url, size=5)
+        for _ in range(pool.breaker.max_failures):
+            pool.fill()
+        assert not pool.breaker.allow()
+        requests = api.requests
+        pool.fill()
+        assert api.requests == requests
+        assert pool.get() is None
+
+
+def test_slow_api_does_not_block_get():
+    with FakeCatAPI(latency=1) as api:
+        pool = CatPool(api.url, size=5)
+        pool.start()
+        try:
+            started = time.monotonic()
+            assert pool.get() is None
+            assert time.monotonic() - started < 0.1
+            # Фоновый поток всё же дождётся ответа и пополнит запас
+            deadline = time.monotonic() + 5
+            while not pool.urls and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert pool.get() is not None
+        finally:
+            pool.stop()
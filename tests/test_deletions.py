@@ -0,0 +1,54 @@
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from db import ConnectionPool
+from deletions import DeletionScheduler, create_deletions_table
+
+
+class Response:
+    status_code = 400
+    reason = "Bad Request"
+    text = ""
+
+
+def make_scheduler(tmp_path, delete):
+    db = ConnectionPool(str(tmp_path / "deletions.db"))
+    with db.connection() as con:
+        create_deletions_table(con.cursor())
+    return DeletionScheduler(db, delete, retry_backoff=30)
+
+
+def pending(scheduler):
+    return scheduler.db.fetchall("SELECT chat_id, message_id, delete_at FROM pending_deletions ORDER BY chat_id")
+
+
+def test_temporary_error_keeps_deletion(tmp_path):
+    calls = []
+
+    def delete(chat_id, message_ids):
+        calls.append((chat_id, message_ids))
+        if len(calls) == 1:
+            raise ConnectionError("сеть недоступна")
+    scheduler = make_scheduler(tmp_path, delete)
+    scheduler.schedule(1, 10, 0)
+    now = time.time()
+    scheduler.flush(now)
+    [(chat_id, message_id, delete_at)] = pending(scheduler)
+    assert (chat_id, message_id) == (1, 10)
+    assert delete_at == now + 30
+    scheduler.flush(now)
+    assert len(calls) == 1
+    scheduler.flush(delete_at)
+    assert calls == [(1, [10]), (1, [10])]
+    assert pending(scheduler) == []
+
+
+def test_permanent_error_drops_deletion(tmp_path):
+    def delete(chat_id, message_ids):
+        raise ApiTelegramException("deleteMessages", Response(),
+                                   {"ok": False, "error_code": 400, "description": "Bad Request: message can't be deleted"})
+    scheduler = make_scheduler(tmp_path, delete)
+    scheduler.schedule(1, 10, 0)
+    scheduler.flush(time.time())
+    assert pending(scheduler) == []
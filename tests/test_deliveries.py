@@ -0,0 +1,38 @@
+import time
+
+from db import ConnectionPool
+from deliveries import DeliveryLedger, create_deliveries_table
+
+DAY = "2030-01-01"
+
+
+def make_ledger(tmp_path):
+    db = ConnectionPool(str(tmp_path / "deliveries.db"))
+    with db.connection() as con:
+        create_deliveries_table(con.cursor())
+    return DeliveryLedger(db)
+
+
+def statuses(ledger):
+    return dict(ledger.db.fetchall("SELECT chat_id, status FROM deliveries ORDER BY chat_id"))
+
+
+def test_chats_of_crashed_shard_are_released(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.enqueue(ledger.claim([1, 2, 3, 4], DAY), DAY, "run")
+    # Процесс run/0 взял пачку и упал; run/1 свою пачку отправил
+    assert ledger.lease("run", "run/0", DAY, 2, -1) == [1, 2]
+    assert ledger.lease("run", "run/1", DAY, 2, 300) == [3, 4]
+    ledger.mark_sent(3, DAY)
+    ledger.mark_sent(4, DAY)
+    assert ledger.release_expired("run", DAY) == 2
+    assert statuses(ledger) == {1: "failed", 2: "failed", 3: "sent", 4: "sent"}
+    assert ledger.claim([1, 2, 3, 4], DAY) == [1, 2]
+
+
+def test_claim_retakes_only_expired_leases(tmp_path):
+    ledger = make_ledger(tmp_path)
+    assert ledger.claim([1, 2], DAY, lease_seconds=300) == [1, 2]
+    assert ledger.claim([1, 2], DAY) == []
+    ledger.db.execute("UPDATE deliveries SET lease_until = ? WHERE chat_id = 1", (time.time() - 1,))
+    assert ledger.claim([1, 2], DAY) == [1]
@@ -0,0 +1,16 @@
+import io
+
+from db import ConnectionPool
+from import_export import import_chats
+
+
+def test_import_chats_keeps_inactive(tmp_path):
+    db = ConnectionPool(str(tmp_path / "chats.db"))
+    db.execute("CREATE TABLE chats (chat_id INTEGER PRIMARY KEY, title TEXT, is_active INTEGER DEFAULT 1, "
+               "mailing_time TEXT DEFAULT '09:00')")
+    rows = ('{"chat_id": 1, "is_active": 0}\n{"chat_id": 2, "is_active": false}\n{"chat_id": 3}\n'
+            '{"chat_id": 4, "is_active": ""}\n{"chat_id": 5, "is_active": 1}\n')
+    report = import_chats(db, io.StringIO(rows), "jsonl", "%H:%M")
+    assert report.inserted == 5
+    assert db.fetchall("SELECT chat_id, is_active FROM chats ORDER BY chat_id") == [(1, 0), (2, 0), (3, 1), (4, 1), (5, 1)]
+    db.close()
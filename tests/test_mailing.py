@@ -0,0 +1,137 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+CHATS = [-1001, -1002, -1003]
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(main, api, monkeypatch):
+    # Три чата в слоте 09:00, фото в базе есть (котиков из сети не качаем), журнал рассылок пуст
+    main.db.execute("DELETE FROM deliveries")
+    main.db.execute("DELETE FROM chats")
+    main.db.executemany("INSERT INTO chats (chat_id, title, mailing_time) VALUES (?, ?, '09:00')",
+                        [(chat_id, f"Чат {chat_id}") for chat_id in CHATS])
+    if not main.db.fetchone("SELECT 1 FROM photo"):
+        main.db.execute("INSERT INTO photo (file_id, caption, caption_folded) VALUES ('photo-1', 'кот', 'кот')")
+    main.load_mailing_schedule()
+    monkeypatch.setattr(main.broadcaster.chats, "interval", 0)
+    clock = Clock(datetime(2030, 1, 1, 9, 0))
+    monkeypatch.setattr(main.ledger, "clock", clock)
+    return clock
+
+
+def sent_once(api):
+    return {chat_id: api.sent[chat_id] for chat_id in CHATS} == {chat_id: 1 for chat_id in CHATS}
+
+
+def test_repeated_catch_up_sends_once(main, api, clock, monkeypatch):
+    # Каждый третий запрос получает 429: повтор после retry_after не должен превращаться во второе сообщение
+    api.throttle_every = 3
+    monkeypatch.setattr(main.broadcaster, "max_retries", 10)
+    main.morning_mailing("09:00")
+    for minutes in (5, 30, 59):
+        clock.now = datetime(2030, 1, 1, 9, minutes)
+        main.catch_up_mailings()
+    assert sent_once(api)
+    assert api.calls["sendPhoto"] > len(CHATS)  # часть отправок получила 429 и ушла повторно
+
+
+def test_catch_up_after_grace_window_skips_slot(main, api, clock):
+    clock.now = datetime(2030, 1, 1, 9, 0) + main.mailing_grace + timedelta(minutes=1)
+    main.catch_up_mailings()
+    assert sum(api.sent.values()) == 0
+    clock.now = datetime(2030, 1, 1, 9, 30)
+    main.catch_up_mailings()
+    assert sent_once(api)
+
+
+def test_day_rollover_sends_again(main, api, clock):
+    main.morning_mailing("09:00")
+    assert sent_once(api)
+    # Назавтра до 09:00 догонять нечего: вчерашний слот давно вне окна
+    clock.now = datetime(2030, 1, 2, 8, 59)
+    main.catch_up_mailings()
+    assert sent_once(api)
+    api.sent.clear()
+    clock.now = datetime(2030, 1, 2, 9, 0)
+    main.morning_mailing("09:00")
+    clock.now = datetime(2030, 1, 2, 9, 20)
+    main.catch_up_mailings()
+    assert sent_once(api)
+
+
+def test_slot_before_midnight_counts_for_its_own_day(main, api, clock):
+    main.db.execute("UPDATE chats SET mailing_time = '23:30'")
+    main.load_mailing_schedule()
+    clock.now = datetime(2030, 1, 1, 23, 30)
+    main.morning_mailing("23:30")
+    # После полуночи catch-up видит вчерашние 23:30 и не шлёт второй раз
+    clock.now = datetime(2030, 1, 2, 0, 10)
+    main.catch_up_mailings()
+    assert sent_once(api)
+    assert {row[0] for row in main.db.fetchall("SELECT date FROM deliveries")} == {"2030-01-01"}
+
+
+def test_failed_send_is_retried_by_catch_up_once(main, api, clock):
+    api.fail_chats = {CHATS[0]}
+    main.morning_mailing("09:00")
+    assert api.sent[CHATS[0]] == 0
+    assert main.db.fetchone("SELECT status FROM deliveries WHERE chat_id = ?", (CHATS[0],))[0] == "failed"
+    api.fail_chats = set()
+    for minutes in (10, 20):
+        clock.now = datetime(2030, 1, 1, 9, minutes)
+        main.catch_up_mailings()
+    assert sent_once(api)
+
+
+def test_bookkeeping_error_does_not_resend(main, api, clock, monkeypatch):
+    mark_sent = main.ledger.mark_sent
+
+    def broken(chat_id, day):
+        if chat_id == CHATS[0]:
+            raise RuntimeError("база недоступна")
+        mark_sent(chat_id, day)
+    monkeypatch.setattr(main.ledger, "mark_sent", broken)
+    main.morning_mailing("09:00")
+    monkeypatch.undo()
+    clock.now = datetime(2030, 1, 1, 9, 10)
+    main.catch_up_mailings()
+    assert sent_once(api)
+
+
+def test_error_after_claim_leaves_chats_to_catch_up(main, api, clock, monkeypatch):
+    get_birthdays = main.get_birthdays
+
+    def locked(*args):
+        monkeypatch.setattr(main, "get_birthdays", get_birthdays)
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(main, "get_birthdays", locked)
+    main.morning_mailing("09:00")
+    assert sum(api.sent.values()) == 0
+    assert {row[0] for row in main.db.fetchall("SELECT status FROM deliveries")} == {"failed"}
+    for minutes in (5, 10, 30):
+        clock.now = datetime(2030, 1, 1, 9, minutes)
+        main.catch_up_mailings()
+    assert sent_once(api)
+
+
+def test_claim_of_crashed_run_expires(main, api, clock):
+    # Процесс захватил чаты и умер, не успев ничего отправить: живой захват catch-up не трогает, истёкший — берёт
+    main.ledger.claim(CHATS, "2030-01-01")
+    clock.now = datetime(2030, 1, 1, 9, 5)
+    main.catch_up_mailings()
+    assert sum(api.sent.values()) == 0
+    main.db.execute("UPDATE deliveries SET lease_until = ?", (time.time() - 1,))
+    main.catch_up_mailings()
+    assert sent_once(api)
@@ -0,0 +1,40 @@
+import json
+import shutil
+import socket
+import ssl
+import subprocess
+import urllib.request
+
+import pytest
+
+from webhook import UpdateDispatcher, WebhookServer
+
+
+@pytest.fixture
+def certificate(tmp_path):
+    if not shutil.which("openssl"):
+        pytest.skip("нужен openssl для самоподписанного сертификата")
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", str(key), "-out", str(cert),
+                    "-days", "1", "-subj", "/CN=localhost"], check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+def test_silent_client_does_not_block_tls_webhook(certificate):
+    received = []
+    dispatcher = UpdateDispatcher(lambda update: received.append(update.update_id))
+    dispatcher.start()
+    server = WebhookServer(dispatcher, host="127.0.0.1", port=0, certfile=certificate[0], keyfile=certificate[1]).start()
+    try:
+        # Клиент подключился и молчит: рукопожатие с ним не должно держать остальных
+        silent = socket.create_connection(("127.0.0.1", server.port))
+        context = ssl.create_default_context(cafile=certificate[0])
+        context.check_hostname = False
+        request = urllib.request.Request(f"https://127.0.0.1:{server.port}/webhook", method="POST",
+                                         data=json.dumps({"update_id": 7}).encode())
+        assert urllib.request.urlopen(request, context=context, timeout=3).status == 200
+        silent.close()
+    finally:
+        server.stop()
+        dispatcher.stop()
+    assert received == [7]
@@ -0,0 +1,199 @@
+import json
+import logging
+import secrets
+import ssl
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Full, Queue
+from threading import Lock, Thread
+
+from telebot import types
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update):
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message:
+            return message.chat.id
+    if update.callback_query and update.callback_query.message:
+        return update.callback_query.message.chat.id
+    for member in (update.my_chat_member, update.chat_member, update.chat_join_request):
+        if member:
+            return member.chat.id
+    return update.update_id
+
+
+class UpdateDispatcher:
+    # Обновления одного чата всегда попадают в одну очередь к одному потоку, поэтому идут по порядку.
+    # Очереди ограничены: если места нет, submit возвращает False, и вебхук просит Telegram повторить позже
+    def __init__(self, process, workers=4, queue_size=1000):
+        self.process = process
+        self.queues = [Queue(maxsize=queue_size) for _ in range(workers)]
+        self.latencies = deque(maxlen=10000)
+        self.processed = 0
+        self.rejected = 0
+        self.lock = Lock()
+        self.threads = []
+
+    def submit(self, update):
+        queue = self.queues[hash(update_chat_id(update)) % len(self.queues)]
+        try:
+            queue.put_nowait((update, time.monotonic()))
+            return True
+        except Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def _work(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            update, received = item
+            try:
+                self.process(update)
+            except Exception as e:
+                logger.exception(f"Ошибка при обработке обновления {update.update_id}: {e}")
+            latency = time.monotonic() - received
+            registry.observe("webhook_update_seconds", latency)
+            with self.lock:
+                self.processed += 1
+                self.latencies.append(latency)
+
+    def start(self):
+        for queue in self.queues:
+            thread = Thread(target=self._work, args=(queue,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+class TLSHTTPServer(ThreadingHTTPServer):
+    # Рукопожатие TLS идёт в потоке запроса и с таймаутом. Если обернуть слушающий сокет, оно выполняется внутри
+    # accept() единственного потока serve_forever, и один молчащий клиент останавливает весь вебхук
+    def __init__(self, address, handler, context, timeout=10):
+        self.context = context
+        self.timeout = timeout
+        super().__init__(address, handler)
+
+    def get_request(self):
+        sock, address = self.socket.accept()
+        sock.settimeout(self.timeout)
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), address
+
+    def finish_request(self, request, client_address):
+        try:
+            request.do_handshake()
+        except (ssl.SSLError, OSError) as e:
+            logger.debug(f"Рукопожатие TLS с {client_address[0]} не удалось: {e}")
+            return
+        super().finish_request(request, client_address)
+
+
+class WebhookServer:
+    # Без certfile отвечает по обычному HTTP: Telegram шлёт вебхуки только на HTTPS, поэтому перед ним нужен
+    # обратный прокси с TLS. С certfile и keyfile TLS поднимается прямо здесь
+    def __init__(self, dispatcher, host="0.0.0.0", port=8443, path="/webhook", secret_token=None, record=None,
+                 certfile=None, keyfile=None):
+        self.dispatcher = dispatcher
+        self.path = path
+        self.secret_token = secret_token
+        self.record = open(record, "a", encoding="utf-8") if record else None
+        self.record_lock = Lock()
+        if certfile:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile, keyfile)
+            self.server = TLSHTTPServer((host, port), self._handler(), context)
+        else:
+            self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def _handler(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != webhook.path:
+                    return self.reply(404)
+                if webhook.secret_token and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != webhook.secret_token:
+                    return self.reply(403)
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode("utf-8")
+                try:
+                    update = types.Update.de_json(json.loads(body))
+                except ValueError:
+                    return self.reply(400)
+                if webhook.record:
+                    with webhook.record_lock:
+                        webhook.record.write(body.replace("\n", " ") + "\n")
+                if not webhook.dispatcher.submit(update):
+                    # Очереди переполнены: Telegram повторит доставку сам
+                    return self.reply(503, {'Retry-After': '1'})
+                self.reply(200)
+
+            def reply(self, status, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.record:
+            self.record.close()
+
+
+def run_webhook(bot, url, host="0.0.0.0", port=8443, path="/webhook", secret_token=None, workers=4, queue_size=1000,
+                record=None, certfile=None, keyfile=None):
+    # Права админа проверяются по from.id из самого обновления, поэтому вебхук без секрета позволил бы любому,
+    # кто достучится до порта, подделать команды. Если секрет не задан, придумываем его на этот запуск
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    dispatcher = UpdateDispatcher(lambda update: bot.process_new_updates([update]), workers=workers, queue_size=queue_size)
+    dispatcher.start()
+    registry.gauge("webhook_queue_depth", dispatcher.depth)
+    registry.gauge("webhook_processed", lambda: dispatcher.processed)
+    registry.gauge("webhook_rejected", lambda: dispatcher.rejected)
+    server = WebhookServer(dispatcher, host=host, port=port, path=path, secret_token=secret_token, record=record,
+                           certfile=certfile, keyfile=keyfile)
+    bot.remove_webhook()
+    if certfile:
+        # Самоподписанный сертификат Telegram примет, только если загрузить его вместе с адресом вебхука
+        with open(certfile, "rb") as certificate:
+            bot.set_webhook(url=url.rstrip("/") + path, secret_token=secret_token, certificate=certificate)
+    else:
+        bot.set_webhook(url=url.rstrip("/") + path, secret_token=secret_token)
+    try:
+        server.serve_forever()
+    finally:
+        dispatcher.stop()